@@ -0,0 +1,158 @@
+"""Structured JSONL access log, written off the request thread."""
+import json
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging import Formatter, Logger, INFO
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import g, request
+
+
+class BackgroundHandler(QueueHandler):
+    """Hands records to `target` on a QueueListener thread, so emitting never blocks on I/O.
+
+    The listener thread doesn't survive a fork, so each process starts its
+    own on first use.
+    """
+
+    def __init__(self, target):
+        super().__init__(queue.SimpleQueue())
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.SimpleQueue()
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+    def close(self):
+        # Drains the queue before the file is closed
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+        self.target.close()
+        super().close()
+
+
+class JSONFormatter(Formatter):
+    """Formats the `access` dict attached to a record as one JSON line."""
+
+    def format(self, record):
+        return json.dumps(record.access, default=str)
+
+
+class ProcessFileHandler(RotatingFileHandler):
+    """RotatingFileHandler whose path may contain {pid}, filled in by each process as it writes.
+
+    Rotation renames the file under any other process writing to it, which
+    then loses lines, so every forked worker needs a file of its own. The
+    pid is resolved on emit rather than when the handler is built, as with
+    gunicorn's preload_app the handler is built in the master.
+    """
+
+    def __init__(self, path, **kwargs):
+        self.path_template = path
+        super().__init__(path.format(pid=os.getpid()), delay=True, **kwargs)
+
+    def emit(self, record):
+        path = os.path.abspath(self.path_template.format(pid=os.getpid()))
+        if path != self.baseFilename:
+            # The stream, if any, is the parent's file
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = path
+        super().emit(record)
+
+
+def rotating_handler(app, path, formatter):
+    """Size-rotated, per-process file handler configured by ACCESS_LOG_MAX_BYTES and ACCESS_LOG_BACKUPS."""
+    handler = ProcessFileHandler(
+        path,
+        maxBytes=app.config.get('ACCESS_LOG_MAX_BYTES', 10 * 1024 * 1024),
+        backupCount=app.config.get('ACCESS_LOG_BACKUPS', 5),
+        encoding='utf-8'
+    )
+    handler.setFormatter(formatter)
+    return handler
+
+
+def init_app(app):
+    """Write one JSON line per sampled request of `app` to ACCESS_LOG_PATH.
+
+    ACCESS_LOG_SAMPLE_RATE (0 to 1) is the share of requests logged; server
+    errors are always logged. Lines carry the route, status, latency, bytes
+    sent and, with SQL instrumentation on, query count and database time.
+    """
+    path = app.config.get('ACCESS_LOG_PATH')
+    if not path:
+        return
+    sample_rate = app.config.get('ACCESS_LOG_SAMPLE_RATE', 1.0)
+
+    # A logger of its own, so access lines don't propagate to the app's handlers
+    logger = Logger('fyyur.access', INFO)
+    logger.addHandler(BackgroundHandler(rotating_handler(app, path, JSONFormatter())))
+    app.extensions['access_log'] = logger
+
+    @app.before_request
+    def start_access_timer():
+        g.access_started = time.perf_counter()
+
+    @app.after_request
+    def record_response(response):
+        g.access_status = response.status_code
+        if response.is_streamed:
+            # Count streamed bytes as they are sent; teardown runs once the stream ends
+            g.access_bytes = 0
+            response.response = count_bytes(response.response, g._get_current_object())
+        else:
+            g.access_bytes = response.content_length
+        return response
+
+    @app.teardown_request
+    def log_request(exc):
+        started = g.pop('access_started', None)
+        if started is None:
+            return
+        status = g.get('access_status', 500)
+        if status < 500 and random.random() >= sample_rate:
+            return
+
+        access = {
+            'time': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': status,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+            'bytes': g.get('access_bytes'),
+            'remote_addr': request.remote_addr,
+        }
+        stats = g.get('sql_stats')
+        if stats is not None:
+            access['queries'] = stats.queries
+            access['db_ms'] = round(stats.db_seconds * 1000, 2)
+        if exc is not None:
+            access['error'] = repr(exc)
+        logger.info('access', extra={'access': access})
+
+
+def count_bytes(chunks, app_globals):
+    for chunk in chunks:
+        app_globals.access_bytes += len(chunk)
+        yield chunk
@@ -3,56 +3,448 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import os
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+import base64
+import operator
+import itertools
+import functools
+import hashlib
+from datetime import datetime, timezone, timedelta
+from flask import Blueprint, Flask, current_app, render_template, request, Response, flash, redirect, url_for, session, make_response, jsonify, stream_with_context
+from werkzeug.http import is_resource_modified
 from flask_moment import Moment
-from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate # Migrate import
 import logging
-from logging import Formatter, FileHandler
-from flask_wtf import Form
-from forms import *
-
-from models import db, Venue, Artist, Show
+import click
+from logging import Formatter
+from forms import VenueForm, ArtistForm, ShowForm
+
+from models import db, Venue, Artist, Show, VenueShowCount, ArtistShowCount
+from cache import PageCache
+import database
+from database import replica_read, statement_timeout, use_statement_timeout
+import instrumentation
+import access_log
+import metrics
+import templating
+import bulk_import
+import bulk_export
+import show_counts
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
-app = Flask(__name__)
-
-
+# Views, error handlers and commands are registered on this blueprint; create_app() builds the app
+bp = Blueprint('main', __name__, cli_group=None)
 
-moment = Moment(app)
-app.config.from_object('config')
-
-# init database
-db.init_app(app)
+moment = Moment()
 
 # Setup migration to local db
-migrate = Migrate(app, db)
+migrate = Migrate()
+
+# Rendered-page cache for the listing pages
+page_cache = PageCache()
+
+def create_app(config='config'):
+  """Build and configure the Fyyur app.
+
+  Everything heavy happens here, once: with gunicorn's preload_app the
+  master builds the app and workers share it copy-on-write. Pooled database
+  connections are dropped in each forked worker (see database.init_app).
+  """
+  app = Flask(__name__)
+  app.config.from_object(config)
+  load_secret_key(app)
+  moment.init_app(app)
+
+  # init database, with pool sizing and statement timeouts from config
+  database.init_app(app, db)
+  db.init_app(app)
+  migrate.init_app(app, db)
+  page_cache.init_app(app)
+
+  # Query counts, DB time and N+1 warnings per request
+  instrumentation.init_app(app)
+
+  # Sampled JSONL access log
+  access_log.init_app(app)
+
+  # Prometheus metrics, scraped from /metrics
+  metrics.init_app(app, db)
+
+  app.register_blueprint(bp)
+  init_error_log(app)
+
+  # Bytecode cache and template precompilation, once the filters are registered
+  templating.init_app(app)
+  return app
+
+def load_secret_key(app):
+  """SECRET_KEY comes from the environment, so every worker signs sessions with the same key."""
+  if app.config.get('SECRET_KEY'):
+     return
+  if not app.debug:
+     raise RuntimeError('Set the SECRET_KEY environment variable')
+  # Development only: sessions are lost on restart
+  app.logger.warning('SECRET_KEY is not set, using a random key')
+  app.config['SECRET_KEY'] = os.urandom(32)
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  """Pre-built datetime formatting function."""
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
+# Shorthand format names accepted by the datetime filter
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+
+# Babel and dateutil are imported on first use, they are slow to load and only needed to format dates
+
+@functools.lru_cache(maxsize=64)
+def datetime_formatter(format, locale):
+  """Compiled Babel pattern and parsed Locale for a format/locale pair, built once."""
+  import babel
+  import babel.dates
+  return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+@bp.app_template_filter('datetime')
+def format_datetime(value, format='medium', locale='en'):
+  """Pre-built datetime formatting function. Takes a datetime or an ISO string."""
+  if isinstance(value, str):
+      import dateutil.parser
+      value = dateutil.parser.parse(value)
+  if format in ('short', 'long'):
+      # Locale-defined formats are left to Babel
+      import babel.dates
+      return babel.dates.format_datetime(value, format, locale=locale)
+  pattern, locale = datetime_formatter(format, locale)
+  return pattern.apply(value, locale)
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def get_limit_arg():
+  """Read `limit` from the query string, clamped to sane bounds."""
+  limit = request.args.get('limit', current_app.config['PAGE_SIZE'], type=int)
+  return min(max(limit, 1), current_app.config['MAX_PAGE_SIZE'])
+
+def encode_cursor(row, columns):
+  """Encode the sort key of `row` as an opaque, URL-safe cursor string."""
+  values = []
+  for column in columns:
+     value = getattr(row, column.key)
+     values.append(value.isoformat() if isinstance(value, datetime) else value)
+  return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+def decode_cursor(cursor, columns):
+  """Decode a cursor produced by `encode_cursor`. Returns None if missing or malformed."""
+  if not cursor:
+     return None
+  try:
+     values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+     if len(values) != len(columns):
+        return None
+     return tuple(
+        datetime.fromisoformat(value) if column.type.python_type is datetime else value
+        for column, value in zip(columns, values)
+     )
+  except (ValueError, TypeError):
+     return None
+
+def page_url(**cursor):
+  """URL of the current listing with its filters kept and the cursor replaced."""
+  # Lists keep repeated filters such as genre=Jazz&genre=Rock
+  args = {key: values for key, values in request.args.lists() if key not in ('after', 'before')}
+  args.update(cursor)
+  return url_for(request.endpoint, **request.view_args, **args)
+
+def keyset_paginate(query, columns, limit, descending=False):
+  """Return one page of `query` ordered by `columns`, plus prev/next links.
+
+  Pages are addressed with `after`/`before` cursors holding the sort key of
+  the last/first row seen, so every page is an index range scan no matter
+  how deep it is. With `descending` the listing runs from the largest key down.
+  """
+  key = db.tuple_(*columns)
+  after = decode_cursor(request.args.get('after'), columns)
+  before = decode_cursor(request.args.get('before'), columns)
+
+  # "ahead" is the direction pages advance in, "behind" the way back to earlier pages
+  ahead, behind = (operator.lt, operator.gt) if descending else (operator.gt, operator.lt)
+  forward_order = [column.desc() if descending else column for column in columns]
+  backward_order = [column if descending else column.desc() for column in columns]
+
+  if before is not None:
+     # Walk backwards from the cursor, then flip the rows back into display order
+     rows = query.filter(behind(key, before)).order_by(*backward_order).limit(limit + 1).all()
+     has_prev = len(rows) > limit
+     rows = rows[:limit][::-1]
+     has_next = True
+  else:
+     if after is not None:
+        query = query.filter(ahead(key, after))
+     rows = query.order_by(*forward_order).limit(limit + 1).all()
+     has_next = len(rows) > limit
+     rows = rows[:limit]
+     has_prev = after is not None
+
+  pagination = {
+     'prev_url': page_url(before=encode_cursor(rows[0], columns)) if rows and has_prev else None,
+     'next_url': page_url(after=encode_cursor(rows[-1], columns)) if rows and has_next else None
+  }
+  return rows, pagination
+
+def name_search(model, search_term):
+  """Filter and ranking for a fuzzy search on `model.name`.
+
+  Matches substrings (ILIKE) as well as near misses via the pg_trgm `<%`
+  word similarity operator, which compares the term with the closest run
+  of words in the name rather than the whole name, so a misspelt part of
+  a name ('musicl' for 'The Musical Hop') still matches. Both are served
+  by the trigram GIN index on name. Results are ranked by word similarity.
+
+  Terms under 3 characters have no trigram of their own, so ILIKE would
+  scan the whole table; they match on word similarity alone.
+  """
+  term = db.literal(search_term, db.String)
+  criterion = term.op('<%')(model.name)
+  if len(search_term.strip()) >= 3:
+     criterion = db.or_(model.name.ilike(f'%{search_term}%'), criterion)
+  rank = db.func.word_similarity(term, model.name).desc()
+  return criterion, rank
+
+def search_response(rows, limit):
+  """Search results for the template from up to `limit` + 1 ranked rows; `more` flags a cut-off list."""
+  return {
+     'count': min(len(rows), limit),
+     'more': len(rows) > limit,
+     'data': [
+        {
+           'id': row.id,
+           'name': row.name,
+           'num_upcoming_shows': row.num_upcoming_shows
+        } for row in rows[:limit]
+     ]
+  }
+
+def upcoming_shows_count(counter):
+  """`num_upcoming_shows` column read from a precomputed counter table.
+
+  `counter` is VenueShowCount or ArtistShowCount, outer-joined by the caller;
+  owners without a counter row have no upcoming shows.
+  """
+  return db.func.coalesce(counter.upcoming_shows, 0).label('num_upcoming_shows')
+
+def partner_shows(show_column, owner_id, partner):
+  """Shows of one venue/artist joined with the columns rendered for the other side.
+
+  `partner` is the model at the other end of each show: Artist on a venue
+  page, Venue on an artist page. Rows carry `<partner>_id`, `<partner>_name`,
+  `<partner>_image_link` and `start_time`, matching the detail templates.
+  """
+  prefix = partner.__tablename__.lower()
+  partner_column = Show.artist_id if partner is Artist else Show.venue_id
+  return db.session.query(
+     Show.id,
+     partner_column.label(f'{prefix}_id'),
+     partner.name.label(f'{prefix}_name'),
+     partner.image_link.label(f'{prefix}_image_link'),
+     Show.start_time
+  ).join(
+     partner, partner_column == partner.id
+  ).filter(show_column == owner_id)
+
+def show_timeframe(when, current_time):
+  """Filter and sort key for upcoming (soonest first) or past (most recent first) shows."""
+  if when == 'upcoming':
+     return Show.start_time >= current_time, False
+  return Show.start_time < current_time, True
+
+def show_data(row):
+  """Template dict for a show row."""
+  return row._asdict()
+
+def detail_shows(show_column, owner_id, partner):
+  """Bounded upcoming/past show lists and their total counts for a detail page."""
+  current_time = datetime.now()
+  limit = current_app.config['DETAIL_SHOWS_LIMIT']
+
+  # Both totals in one pass over the (fk, start_time) index
+  past_count, upcoming_count = db.session.query(
+     db.func.count(Show.id).filter(Show.start_time < current_time),
+     db.func.count(Show.id).filter(Show.start_time >= current_time)
+  ).filter(show_column == owner_id).one()
+
+  shows = {}
+  for when in ('upcoming', 'past'):
+     criterion, descending = show_timeframe(when, current_time)
+     order = [Show.start_time.desc(), Show.id.desc()] if descending else [Show.start_time, Show.id]
+     # Row versions of each show and its partner, for detail_validators
+     rows = partner_shows(show_column, owner_id, partner).add_columns(
+        Show.updated_at.label('show_updated_at'),
+        partner.updated_at.label('partner_updated_at')
+     ).filter(criterion).order_by(*order).limit(limit).all()
+     shows[when] = [show_data(row) for row in rows]
+
+  return {
+     'past_shows': shows['past'],
+     'upcoming_shows': shows['upcoming'],
+     'past_shows_count': past_count,
+     'upcoming_shows_count': upcoming_count
+  }
 
-app.jinja_env.filters['datetime'] = format_datetime
+def detail_validators(owner, shows):
+  """ETag and Last-Modified for a venue/artist detail page.
+
+  Built from exactly what the page renders: the `owner` row and the bounded
+  show lists of `detail_shows`, whose rows carry their own and their
+  partner's updated_at. The show counts catch deletions outside the lists
+  and, with the newest past show, shows moving from upcoming to past. So
+  the cost is that of the page's own queries, not of the owner's history.
+  """
+  listed = [
+     (show['id'], show['show_updated_at'], show['partner_updated_at'])
+     for when in ('upcoming_shows', 'past_shows') for show in shows[when]
+  ]
+  etag = hashlib.sha1(repr((
+     owner.__tablename__, owner.id, owner.updated_at,
+     shows['upcoming_shows_count'], shows['past_shows_count'], listed
+  )).encode()).hexdigest()
+
+  # updated_at is naive UTC, start_time is naive local time
+  stamps = [owner.updated_at, *(stamp for _, *versions in listed for stamp in versions)]
+  stamps = [stamp.replace(tzinfo=timezone.utc) for stamp in stamps]
+  if shows['past_shows']:
+     stamps.append(shows['past_shows'][0]['start_time'].astimezone(timezone.utc))
+  last_modified = max(stamps)
+  return etag, last_modified
+
+def not_modified(etag, last_modified):
+  """304 response if the client's If-None-Match/If-Modified-Since still match, else None."""
+  # Pending flash messages have to be rendered, so never short-circuit those requests
+  if session.get('_flashes'):
+     return None
+  if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+     return None
+  return with_validators(Response(status=304), etag, last_modified)
+
+def with_validators(response, etag, last_modified):
+  """Attach the validators, asking browsers to revalidate before reusing the page."""
+  response = make_response(response)
+  response.set_etag(etag)
+  response.last_modified = last_modified
+  response.cache_control.no_cache = True
+  return response
+
+def json_default(value):
+  """JSON encoder fallback for datetimes."""
+  if isinstance(value, datetime):
+     return value.isoformat()
+  raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def stream_ndjson(statement):
+  """Stream the rows of `statement` as newline-delimited JSON.
+
+  Rows are pulled from a server-side cursor in batches of API_STREAM_BATCH,
+  so memory stays flat however many rows the client reads.
+  """
+  statement = statement.execution_options(yield_per=current_app.config['API_STREAM_BATCH'])
+
+  def generate():
+     result = db.session.execute(statement)
+     try:
+        for row in result.mappings():
+           yield json.dumps(dict(row), default=json_default) + '\n'
+     finally:
+        result.close()
+
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def datetime_arg(name):
+  """Parse an ISO 8601 query-string argument. Raises ValueError on bad input."""
+  value = request.args.get(name)
+  return datetime.fromisoformat(value) if value else None
+
+def area_filters(model):
+  """city/state query-string filters."""
+  criteria = []
+  if request.args.get('city'):
+     criteria.append(model.city == request.args['city'])
+  if request.args.get('state'):
+     criteria.append(model.state == request.args['state'])
+  return criteria
+
+def genre_filters(model):
+  """genre query-string filter, repeatable. Both forms are served by the GIN index on genres."""
+  genres = request.args.getlist('genre')
+  if not genres:
+     return []
+  if request.args.get('match') == 'any':
+     # Rows listing at least one of the genres (&&)
+     return [model.genres.overlap(genres)]
+  # Rows listing every requested genre (@>)
+  return [model.genres.contains(genres)]
+
+def location_filters(model):
+  """city/state/genre query-string filters shared by the listings and the APIs."""
+  return area_filters(model) + genre_filters(model)
+
+def genre_facets(model, namespace):
+  """Number of rows per genre within the city/state filters, most common first.
+
+  Cached with the listing pages of `namespace`, so it's recomputed only
+  after a write to that listing.
+  """
+  def count_genres():
+     genre = db.func.unnest(model.genres).column_valued('genre')
+     rows = db.session.execute(
+        db.select(genre, db.func.count().label('count')).select_from(model)
+        .where(*area_filters(model)).group_by(genre).order_by(db.desc('count'), genre)
+     )
+     return [{'genre': row.genre, 'count': row.count} for row in rows]
+
+  key = f"genres:{request.args.get('city', '')}|{request.args.get('state', '')}"
+  return page_cache.memoize(namespace, key, count_genres)
+
+def facet_links(facets):
+  """Facets with a link to the listing narrowed to each genre, keeping the city/state filters."""
+  selected = request.args.getlist('genre')
+  area = {key: request.args[key] for key in ('city', 'state') if request.args.get(key)}
+  return [
+     dict(facet, selected=facet['genre'] in selected, url=url_for(request.endpoint, genre=facet['genre'], **area))
+     for facet in facets
+  ]
+
+def booked_during(show_column, owner_id, start_time, end_time):
+  """Criterion for shows of the venue/artist `owner_id` overlapping [start_time, end_time).
+
+  Matches the GiST (owner, tsrange(start_time, end_time)) indexes on Show.
+  """
+  during = db.func.tsrange(Show.start_time, Show.end_time)
+  return db.and_(show_column == owner_id, during.op('&&')(db.func.tsrange(start_time, end_time)))
+
+def booking_conflict(venue_id, artist_id, start_time, end_time):
+  """The first show that would overlap a new booking of the venue or the artist, or None."""
+  return db.session.query(
+     Show.venue_id,
+     Show.artist_id,
+     Show.start_time,
+     Show.end_time
+  ).filter(
+     db.or_(
+        booked_during(Show.venue_id, venue_id, start_time, end_time),
+        booked_during(Show.artist_id, artist_id, start_time, end_time)
+     )
+  ).order_by(Show.start_time).first()
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
-@app.route('/')
+@bp.route('/')
 def index():
   return render_template('pages/home.html')
 
@@ -60,114 +452,107 @@ def index():
 #  Venues
 #  ----------------------------------------------------------------
 
-@app.route('/venues')
+@bp.route('/venues')
+@replica_read
+@page_cache.cached('venues')
 def venues():
-  """Display all venues."""
-
-  # get local time
-  current_time = datetime.now()
-
-  # initialize areas dict
-  areas = {}
-
-  # query all venues
-  venues = Venue.query.all()
-
-  for venue in venues:
-     # filter shows by a corresponding venue ID and if the start time is upcoming (in the future), then count
-     upcoming_shows_count = Show.query.filter(Show.venue_id == venue.id, Show.start_time > current_time).count()
-     
-     # define the venue data
-     venue_data = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": upcoming_shows_count
-     }
-     
-     # define the location, combination of city and state for unique identifier
-     location = f'{venue.city}, {venue.state}'
-
-     # if the location isn't in the area dict, add it and make the current venue the first venue in its venues list
-     if location not in areas:
-        areas[location] = {
-           "city": venue.city,
-           "state": venue.state,
-           "venues": [venue_data]
-        }
-     # if it IS in the area dict, append this venue to the venues list
-     else:
-        areas[location]["venues"].append(venue_data)
-
-  data = list(areas.values())
+  """Display venue areas with their venue counts, or the venues of one area with ?state=&city=."""
+  if request.args.get('state') and request.args.get('city'):
+     # One area: a page of its venues along with their upcoming show counts, in a single
+     # range scan of the (state, city, id) index
+     venues, pagination = keyset_paginate(
+        db.session.query(
+           Venue.id,
+           Venue.name,
+           Venue.city,
+           Venue.state,
+           upcoming_shows_count(VenueShowCount)
+        ).outerjoin(VenueShowCount, VenueShowCount.venue_id == Venue.id).filter(*location_filters(Venue)),
+        [Venue.state, Venue.city, Venue.id],
+        get_limit_arg()
+     )
 
-  return render_template('pages/venues.html', areas=data);
+     # Rows arrive ordered by area, so grouping is a single pass
+     data = [
+        {
+           'city': city,
+           'state': state,
+           'venues': [
+              {
+                 'id': venue.id,
+                 'name': venue.name,
+                 'num_upcoming_shows': venue.num_upcoming_shows
+              } for venue in area_venues
+           ]
+        } for (state, city), area_venues in itertools.groupby(venues, key=operator.attrgetter('state', 'city'))
+     ]
+  else:
+     # Areas only (the cities of one state with ?state=), each linking to its venues
+     areas, pagination = keyset_paginate(
+        db.session.query(
+           Venue.state,
+           Venue.city,
+           db.func.count(Venue.id).label('num_venues')
+        ).filter(*location_filters(Venue)).group_by(Venue.state, Venue.city),
+        [Venue.state, Venue.city],
+        get_limit_arg()
+     )
 
-@app.route('/venues/search', methods=['POST'])
+     genres = {key: request.args.getlist(key) for key in ('genre', 'match') if key in request.args}
+     data = [
+        {
+           'city': area.city,
+           'state': area.state,
+           'num_venues': area.num_venues,
+           'url': url_for('.venues', state=area.state, city=area.city, **genres)
+        } for area in areas
+     ]
+
+  return render_template('pages/venues.html', areas=data, pagination=pagination,
+                         facets=facet_links(genre_facets(Venue, 'venues')))
+
+@bp.route('/venues/search', methods=['POST'])
+@replica_read
+@statement_timeout('search')
 def search_venues():
   """Search for specific venues."""
   search_term = request.form.get('search_term', '')
 
-  # Partial string search with SQLAlchemy. Filters a query from the Venue table using partial string search.
-  # Returns all results.
-  search_results = Venue.query.filter(
-     Venue.name.ilike(f'%{search_term}%')
-  ).all()
-
-  # Create response dict. Count number of venue hits then initialize empty data list.
-  response = {
-     'count': len(search_results),
-     'data': []
-  }
-
-  # Get current time
-  current_time = datetime.now()
-
-  # filter shows by a corresponding venue ID and if the start time is upcoming (in the future), then count
-  for venue in search_results:
-     num_upcoming_shows = Show.query.filter(
-        Show.venue_id == venue.id,
-        Show.start_time > current_time
-     ).count()
-
-     response["data"].append(
-        {
-           'id': venue.id,
-           'name': venue.name,
-           'num_upcoming_shows': num_upcoming_shows
-        }
-     )
+  # Fuzzy search on the trigram index of Venue.name: the best matches first, capped at
+  # SEARCH_RESULTS_LIMIT so short or common terms don't sort and render half the table
+  limit = current_app.config['SEARCH_RESULTS_LIMIT']
+  criterion, rank = name_search(Venue, search_term)
+  search_results = db.session.query(
+     Venue.id,
+     Venue.name,
+     upcoming_shows_count(VenueShowCount)
+  ).outerjoin(
+     VenueShowCount, VenueShowCount.venue_id == Venue.id
+  ).filter(criterion).order_by(rank, Venue.name).limit(limit + 1).all()
+
+  # Create response dict, upcoming show counts come with each row.
+  response = search_response(search_results, limit)
 
   return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
-@app.route('/venues/<int:venue_id>')
+@bp.route('/venues/<int:venue_id>')
+@replica_read
 def show_venue(venue_id):
   """Show venue details for a given venue."""
   
-  # Query venue from Venue table using given ID
-  venue = Venue.query.get(venue_id)
+  # Query venue from Venue table using given ID, shows are fetched separately below
+  venue = Venue.query.options(db.noload(Venue.shows)).get(venue_id)
 
   # Handle if a venue wasn't supplied properly
   if not venue:
      return render_template('errors/404.html'), 404
-  
-  # Grab current time
-  current_time = datetime.now()
 
-  # Query past and future shows by filtering based on time comparison to current
-  past_shows_data = []
-  upcoming_shows_data = []
-
-  for show in venue.shows:
-     queried_show = {
-           'artist_id': show.artist_id,
-           'artist_name': show.artist.name,
-           'artist_image_link': show.artist.image_link,
-           'start_time': show.start_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-      }
-     if show.start_time < current_time:
-        past_shows_data.append(queried_show)
-     else:
-        upcoming_shows_data.append(queried_show)
+  # Answer conditional GETs from the page's own queries, before rendering
+  shows = detail_shows(Show.venue_id, venue.id, Artist)
+  validators = detail_validators(venue, shows)
+  unchanged = not_modified(*validators)
+  if unchanged:
+     return unchanged
   
   # Construct data dict for template
   data = {
@@ -183,24 +568,42 @@ def show_venue(venue_id):
      'seeking_talent': venue.looking_for_talent,
      'seeking_description': venue.seeking_description,
      'image_link': venue.image_link,
-     'past_shows': past_shows_data,
-     'upcoming_shows': upcoming_shows_data,
-     'past_shows_count': len(past_shows_data),
-     'upcoming_shows_count': len(upcoming_shows_data)
+     # Most recent past shows and soonest upcoming shows, with full counts
+     **shows
   }
 
-  return render_template('pages/show_venue.html', venue=data)
+  return with_validators(render_template('pages/show_venue.html', venue=data), *validators)
+
+@bp.route('/venues/<int:venue_id>/shows/<any(upcoming, past):when>')
+@replica_read
+def venue_shows(venue_id, when):
+  """Page through a venue's upcoming or past shows beyond what the detail page shows."""
+  venue = db.session.query(Venue.id, Venue.name).filter(Venue.id == venue_id).first()
+
+  if not venue:
+     return render_template('errors/404.html'), 404
+
+  criterion, descending = show_timeframe(when, datetime.now())
+  shows, pagination = keyset_paginate(
+     partner_shows(Show.venue_id, venue.id, Artist).filter(criterion),
+     [Show.start_time, Show.id],
+     get_limit_arg(),
+     descending=descending
+  )
+
+  return render_template('pages/venue_shows.html', venue=venue, when=when,
+                         shows=[show_data(show) for show in shows], pagination=pagination)
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
-@app.route('/venues/create', methods=['GET'])
+@bp.route('/venues/create', methods=['GET'])
 def create_venue_form():
   """Pre-built function. Create venue form."""
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
-@app.route('/venues/create', methods=['POST'])
+@bp.route('/venues/create', methods=['POST'])
 def create_venue_submission():
   """Create the venue submission and add it to the DB."""
 
@@ -227,6 +630,8 @@ def create_venue_submission():
       db.session.add(new_venue)
       # Commit the session to the database to really save it
       db.session.commit()
+      # Drop the cached listing pages that render this data
+      page_cache.invalidate('venues')
       # Flash the success message
       flash('Venue ' + new_venue.name + ' was successfully listed!')
     except Exception as e:
@@ -251,7 +656,7 @@ def create_venue_submission():
 
   return render_template('pages/home.html') # Redirect to homepage
 
-@app.route('/venues/<venue_id>', methods=['DELETE'])
+@bp.route('/venues/<venue_id>', methods=['DELETE'])
 def delete_venue(venue_id):
   """Delete a venue given an ID."""
   # Bonus challenge was not completed in the interest of time.
@@ -267,6 +672,8 @@ def delete_venue(venue_id):
      # Delete the venue entry from the Venue table in the database
      db.session.delete(venue)
      db.session.commit()
+     # Drop the cached listing pages that render this data
+     page_cache.invalidate('venues', 'shows')
 
      # Flash deletion success message
      flash(f'Venue {venue.name} was successfully deleted!')
@@ -286,10 +693,16 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
+@bp.route('/artists')
+@replica_read
+@page_cache.cached('artists')
 def artists():
-  """Display all artists."""
-  artists = Artist.query.all()
+  """Display one page of artists."""
+  artists, pagination = keyset_paginate(
+     db.session.query(Artist.id, Artist.name).filter(*location_filters(Artist)),
+     [Artist.id],
+     get_limit_arg()
+  )
 
   # Populate 'data' as a list of dictionaries
   data = [
@@ -299,73 +712,50 @@ def artists():
      } for artist in artists
   ]
 
-  return render_template('pages/artists.html', artists=data)
+  return render_template('pages/artists.html', artists=data, pagination=pagination,
+                         facets=facet_links(genre_facets(Artist, 'artists')))
 
-@app.route('/artists/search', methods=['POST'])
+@bp.route('/artists/search', methods=['POST'])
+@replica_read
+@statement_timeout('search')
 def search_artists():
   search_term = request.form.get('search_term', '')
 
-  # Partial string search with SQLAlchemy. Filters a query from the Artist table using partial string search.
-  # Returns all results.
-  search_results = Artist.query.filter(
-     Artist.name.ilike(f'%{search_term}%')
-  ).all()
-
-  # Create response dict. Count number of artist hits then initialize empty data list.
-  response = {
-     'count': len(search_results),
-     'data': []
-  }
+  # Fuzzy search on the trigram index of Artist.name: the best matches first, capped at
+  # SEARCH_RESULTS_LIMIT so short or common terms don't sort and render half the table
+  limit = current_app.config['SEARCH_RESULTS_LIMIT']
+  criterion, rank = name_search(Artist, search_term)
+  search_results = db.session.query(
+     Artist.id,
+     Artist.name,
+     upcoming_shows_count(ArtistShowCount)
+  ).outerjoin(
+     ArtistShowCount, ArtistShowCount.artist_id == Artist.id
+  ).filter(criterion).order_by(rank, Artist.name).limit(limit + 1).all()
+
+  # Create response dict, upcoming show counts come with each row.
+  response = search_response(search_results, limit)
 
-  # Calculate current time
-  current_time = datetime.now()
-
-  # filter shows by a corresponding artist ID and if the start time is upcoming (in the future), then count
-  for artist in search_results:
-     num_upcoming_shows = Show.query.filter(
-        Show.artist_id == artist.id,
-        Show.start_time > current_time
-     ).count()
-
-     response["data"].append(
-        {
-           'id': artist.id,
-           'name': artist.name,
-           'num_upcoming_shows': num_upcoming_shows
-        }
-     )
-  
   return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term'))
 
-@app.route('/artists/<int:artist_id>')
+@bp.route('/artists/<int:artist_id>')
+@replica_read
 def show_artist(artist_id):
   """Show details for a specific ID."""
-  # query the Artist from the Artist table by artist_id
-  artist = Artist.query.get(artist_id)
+  # query the Artist from the Artist table by artist_id, shows are fetched separately below
+  artist = Artist.query.options(db.noload(Artist.shows)).get(artist_id)
 
   # Flash an error if bad input was given
   if not artist:
      flash(f'Artist ID {artist_id} does not exist.')
      return render_template('errors/404.html'), 404
-  
-  # Calc current time
-  current_time = datetime.now()
 
-  # Query past and future shows by filtering based on time comparison to current
-  past_shows_data = []
-  upcoming_shows_data = []
-
-  for show in artist.shows:
-     queried_show = {
-           'venue_id': show.venue_id,
-           'venue_name': show.venue.name,
-           'venue_image_link': show.venue.image_link,
-           'start_time': show.start_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-      }
-     if show.start_time < current_time:
-        past_shows_data.append(queried_show)
-     else:
-        upcoming_shows_data.append(queried_show)
+  # Answer conditional GETs from the page's own queries, before rendering
+  shows = detail_shows(Show.artist_id, artist.id, Venue)
+  validators = detail_validators(artist, shows)
+  unchanged = not_modified(*validators)
+  if unchanged:
+     return unchanged
   
   # Construct data dict for template
   data = {
@@ -380,22 +770,40 @@ def show_artist(artist_id):
      'seeking_venue': artist.looking_for_venues,
      'seeking_description': artist.seeking_description,
      'image_link': artist.image_link,
-     'past_shows': past_shows_data,
-     'upcoming_shows': upcoming_shows_data,
-     'past_shows_count': len(past_shows_data),
-     'upcoming_shows_count': len(upcoming_shows_data)
+     # Most recent past shows and soonest upcoming shows, with full counts
+     **shows
   }
 
-  return render_template('pages/show_artist.html', artist=data)
+  return with_validators(render_template('pages/show_artist.html', artist=data), *validators)
+
+@bp.route('/artists/<int:artist_id>/shows/<any(upcoming, past):when>')
+@replica_read
+def artist_shows(artist_id, when):
+  """Page through an artist's upcoming or past shows beyond what the detail page shows."""
+  artist = db.session.query(Artist.id, Artist.name).filter(Artist.id == artist_id).first()
+
+  if not artist:
+     return render_template('errors/404.html'), 404
+
+  criterion, descending = show_timeframe(when, datetime.now())
+  shows, pagination = keyset_paginate(
+     partner_shows(Show.artist_id, artist.id, Venue).filter(criterion),
+     [Show.start_time, Show.id],
+     get_limit_arg(),
+     descending=descending
+  )
+
+  return render_template('pages/artist_shows.html', artist=artist, when=when,
+                         shows=[show_data(show) for show in shows], pagination=pagination)
 
 #  Update
 #  ----------------------------------------------------------------
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
   """Edit artist details given an ID."""
 
   # Query artist by artist_id
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.options(db.noload(Artist.shows)).get(artist_id)
 
   if not artist:
      flash(f'Artist ID {artist_id} does not exist.')
@@ -421,10 +829,10 @@ def edit_artist(artist_id):
 
   return render_template('forms/edit_artist.html', form=form, artist=artist_data)
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@bp.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
   # query artist with artist_id from Artist table
-  artist = Artist.query.get(artist_id)
+  artist = Artist.query.options(db.noload(Artist.shows)).get(artist_id)
 
   # Handle if artist ID DNE
   if not artist:
@@ -449,6 +857,8 @@ def edit_artist_submission(artist_id):
 
      # Save changes to db
      db.session.commit()
+     # Drop the cached listing pages that render this data
+     page_cache.invalidate('artists', 'shows')
      flash(f'{artist.name} was successfully updated!')
   except Exception as e:
      # rollback session if an error occurred
@@ -460,13 +870,13 @@ def edit_artist_submission(artist_id):
      # close session to cleanup
      db.session.close()
 
-  return redirect(url_for('show_artist', artist_id=artist_id))
+  return redirect(url_for('.show_artist', artist_id=artist_id))
 
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
   """Edit venue details given an ID."""
   # query venue by ID
-  venue = Venue.query.get(venue_id)
+  venue = Venue.query.options(db.noload(Venue.shows)).get(venue_id)
 
   # Flash an error if bad ID was given
   if not venue:
@@ -494,12 +904,12 @@ def edit_venue(venue_id):
 
   return render_template('forms/edit_venue.html', form=form, venue=data)
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@bp.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
   """Save venue edits to the DB."""
 
   # Query venue by ID
-  venue = Venue.query.get(venue_id)
+  venue = Venue.query.options(db.noload(Venue.shows)).get(venue_id)
 
   # Flash an error if bad ID was given
   if not venue:
@@ -525,6 +935,8 @@ def edit_venue_submission(venue_id):
 
      # Save changes
      db.session.commit()
+     # Drop the cached listing pages that render this data
+     page_cache.invalidate('venues', 'shows')
      flash(f'Venue {venue.name} was successfully updated!')
   except Exception as e:
      # Abort changes if an error occurred
@@ -536,18 +948,18 @@ def edit_venue_submission(venue_id):
      # Close session to cleanup
      db.session.close()
      
-  return redirect(url_for('show_venue', venue_id=venue_id))
+  return redirect(url_for('.show_venue', venue_id=venue_id))
 
 #  Create Artist
 #  ----------------------------------------------------------------
 
-@app.route('/artists/create', methods=['GET'])
+@bp.route('/artists/create', methods=['GET'])
 def create_artist_form():
   """Pre-built function. Designs the create artist form."""
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@bp.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     """Save the new artist details to the db."""
   # called upon submitting the new artist listing form
@@ -571,6 +983,8 @@ def create_artist_submission():
         db.session.add(new_artist)
         # Commit the session to the database to really save it
         db.session.commit()
+        # Drop the cached listing pages that render this data
+        page_cache.invalidate('artists')
         # Flash the success message
         flash('Artist ' + new_artist.name + ' was successfully listed!')
       except Exception as e:
@@ -599,39 +1013,52 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
-@app.route('/shows')
+@bp.route('/shows')
+@replica_read
+@page_cache.cached('shows')
 def shows():
-  """Display all shows."""
-  # Query all shows
-  shows = Show.query.all()
-
-  # Intialize empty list of dictionaries
-  data = []
-  for show in shows:
-     # query the venue and artist from the show data
-     venue = Venue.query.get(show.venue_id)
-     artist = Artist.query.get(show.artist_id)
-     # Construct the show_data dict
-     show_data = {
+  """Display one page of shows."""
+  # Join the venue and artist in a single query, selecting only the columns the template uses
+  shows, pagination = keyset_paginate(
+     db.session.query(
+        Show.id,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time
+     ).join(
+        Venue, Show.venue_id == Venue.id
+     ).join(
+        Artist, Show.artist_id == Artist.id
+     ),
+     [Show.start_time, Show.id],
+     get_limit_arg()
+  )
+
+  # Construct the list of show_data dicts
+  data = [
+     {
         'venue_id': show.venue_id,
-        'venue_name': venue.name,
+        'venue_name': show.venue_name,
         'artist_id': show.artist_id,
-        'artist_name': artist.name,
-        'artist_image_link': artist.image_link,
-        'start_time': show.start_time.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
-     }
-     data.append(show_data)
+        'artist_name': show.artist_name,
+        'artist_image_link': show.artist_image_link,
+        'start_time': show.start_time
+     } for show in shows
+  ]
 
-  return render_template('pages/shows.html', shows=data)
+  return render_template('pages/shows.html', shows=data, pagination=pagination)
 
-@app.route('/shows/create')
+@bp.route('/shows/create')
 def create_shows():
   """Pre-built function. Creates the ShowForm form."""
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@bp.route('/shows/create', methods=['POST'])
 def create_show_submission():
   """Save new show to the DB."""
   # Create a form from input data
@@ -639,24 +1066,40 @@ def create_show_submission():
   if form.validate():
     try:
       # Query the Artist and Venue with the specified IDs. Throw an exception if not found.
-      artist = Artist.query.get(form.artist_id.data)
+      # Both rows are locked, so concurrent bookings of the same venue or artist are checked one at a time
+      artist = db.session.get(Artist, form.artist_id.data, options=[db.noload(Artist.shows)], with_for_update=True)
       if not artist:
           raise ValueError(f'Artist ID {form.artist_id.data} does not exist.')
 
       # Check if the venue_id exists in the Venue table
-      venue = Venue.query.get(form.venue_id.data)
+      venue = db.session.get(Venue, form.venue_id.data, options=[db.noload(Venue.shows)], with_for_update=True)
       if not venue:
           raise ValueError(f'Venue ID {form.venue_id.data} does not exist.')
 
+      start_time = form.start_time.data
+      end_time = start_time + timedelta(minutes=form.duration.data or current_app.config['SHOW_DEFAULT_DURATION'])
+
+      # Refuse double bookings of the venue or the artist
+      conflict = booking_conflict(venue.id, artist.id, start_time, end_time)
+      if conflict:
+          db.session.rollback()
+          booked = venue.name if conflict.venue_id == venue.id else artist.name
+          flash(f'{booked} is already booked from {format_datetime(conflict.start_time)} '
+                f'to {format_datetime(conflict.end_time)}. Show could not be listed.')
+          return render_template('forms/new_show.html', form=form)
+
       # Create the new show object for insert into db
       new_show = Show(
-          artist_id = form.artist_id.data,
-          venue_id = form.venue_id.data,
-          start_time = form.start_time.data
+          artist_id = artist.id,
+          venue_id = venue.id,
+          start_time = start_time,
+          end_time = end_time
       )
       # Add and commit to db
       db.session.add(new_show)
       db.session.commit()
+      # Drop the cached listing pages that render this data
+      page_cache.invalidate('shows')
       # on successful db insert, flash success
       flash('Show was successfully listed!')
     except Exception as e:
@@ -680,24 +1123,225 @@ def create_show_submission():
 
   return render_template('pages/home.html')
 
-@app.errorhandler(404)
+#  API
+#  ----------------------------------------------------------------
+
+@bp.route('/api/venues')
+@replica_read
+@statement_timeout('export')
+def api_venues():
+  """Stream venues as NDJSON, optionally filtered by city, state and genre."""
+  statement = db.select(*Venue.__table__.columns).where(*location_filters(Venue)).order_by(Venue.id)
+  return stream_ndjson(statement)
+
+@bp.route('/api/venues/genres')
+@replica_read
+def api_venue_genres():
+  """Venue counts per genre, optionally within a city/state."""
+  return jsonify(genre_facets(Venue, 'venues'))
+
+@bp.route('/api/venues/available')
+@replica_read
+@statement_timeout('search')
+def api_available_venues():
+  """Stream venues with no show overlapping `start`..`end` as NDJSON.
+
+  Takes the city/state/genre filters of /api/venues, e.g.
+  /api/venues/available?state=NY&start=2026-10-23T20:00&end=2026-10-23T23:00
+  """
+  try:
+     start = datetime_arg('start')
+     end = datetime_arg('end')
+  except ValueError as e:
+     return jsonify({'error': f'Invalid datetime: {e}'}), 400
+  if not start or not end or end <= start:
+     return jsonify({'error': 'start and end are required, with end after start'}), 400
+
+  # One GiST index probe per candidate venue
+  booked = db.select(Show.id).where(booked_during(Show.venue_id, Venue.id, start, end)).exists()
+  statement = db.select(*Venue.__table__.columns).where(
+     *location_filters(Venue), ~booked
+  ).order_by(Venue.id)
+  return stream_ndjson(statement)
+
+@bp.route('/api/artists')
+@replica_read
+@statement_timeout('export')
+def api_artists():
+  """Stream artists as NDJSON, optionally filtered by city, state and genre."""
+  statement = db.select(*Artist.__table__.columns).where(*location_filters(Artist)).order_by(Artist.id)
+  return stream_ndjson(statement)
+
+@bp.route('/api/artists/genres')
+@replica_read
+def api_artist_genres():
+  """Artist counts per genre, optionally within a city/state."""
+  return jsonify(genre_facets(Artist, 'artists'))
+
+@bp.route('/api/shows')
+@replica_read
+@statement_timeout('export')
+def api_shows():
+  """Stream shows with their venue and artist names as NDJSON.
+
+  Filters: venue_id, artist_id, the venue's city/state/genre, and a
+  start_time range given as ISO 8601 `start_after`/`start_before`.
+  """
+  try:
+     start_after = datetime_arg('start_after')
+     start_before = datetime_arg('start_before')
+  except ValueError as e:
+     return jsonify({'error': f'Invalid datetime: {e}'}), 400
+
+  criteria = location_filters(Venue)
+  if request.args.get('venue_id', type=int):
+     criteria.append(Show.venue_id == request.args.get('venue_id', type=int))
+  if request.args.get('artist_id', type=int):
+     criteria.append(Show.artist_id == request.args.get('artist_id', type=int))
+  if start_after:
+     criteria.append(Show.start_time >= start_after)
+  if start_before:
+     criteria.append(Show.start_time < start_before)
+
+  statement = db.select(
+     Show.id,
+     Show.start_time,
+     Show.end_time,
+     Show.venue_id,
+     Venue.name.label('venue_name'),
+     Show.artist_id,
+     Artist.name.label('artist_name')
+  ).join(
+     Venue, Show.venue_id == Venue.id
+  ).join(
+     Artist, Show.artist_id == Artist.id
+  ).where(*criteria).order_by(Show.start_time, Show.id)
+  return stream_ndjson(statement)
+
+@bp.route('/api/pool')
+def api_pool():
+  """Connection pool occupancy and checkout wait times for this worker process."""
+  return jsonify(database.pool_status(db))
+
+@bp.route('/metrics')
+def metrics_endpoint():
+  """Prometheus metrics, summed over every worker when PROMETHEUS_MULTIPROC_DIR is set."""
+  metrics.update_pool_gauges(db)
+  body, content_type = metrics.exposition()
+  return Response(body, content_type=content_type)
+
+@bp.route('/export/<any(venues, artists, shows):kind>.csv')
+@replica_read
+@statement_timeout('export')
+def export_csv(kind):
+  """Stream a full CSV dump of venues, artists or shows."""
+  chunks = bulk_export.csv_chunks(kind, current_app.config['EXPORT_BATCH_SIZE'])
+  return Response(
+     stream_with_context(chunks),
+     mimetype='text/csv',
+     headers={'Content-Disposition': f'attachment; filename={kind}.csv'}
+  )
+
+@bp.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+def init_error_log(app):
+  """Log INFO and above to ERROR_LOG_PATH outside debug mode."""
+  if app.debug:
+     return
+  # Written from a background thread, so logging never waits on the disk
+  file_handler = access_log.rotating_handler(
+      app, app.config['ERROR_LOG_PATH'], Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+  )
+  app.logger.setLevel(logging.INFO)
+  file_handler.setLevel(logging.INFO)
+  app.logger.addHandler(access_log.BackgroundHandler(file_handler))
+  app.logger.info('errors')
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+# Listing pages affected by loading each kind of row
+IMPORT_INVALIDATES = {
+  'venues': ('venues', 'shows'),
+  'artists': ('artists', 'shows'),
+  'shows': ('shows',)
+}
+
+@bp.cli.command('import')
+@click.argument('kind', type=click.Choice(list(bulk_import.MODELS)))
+@click.argument('source', type=click.File('r', encoding='utf-8'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']),
+              help='Input format. Defaults to jsonl for .jsonl/.ndjson files, csv otherwise.')
+@click.option('--rejects', type=click.File('w', encoding='utf-8', lazy=True),
+              help='Write rejected rows, with line number and reason, to this CSV file.')
+def import_command(kind, source, fmt, rejects):
+  """Bulk load venues, artists or shows from a CSV or JSONL file.
+
+  Columns are named after the model fields; rows with an id update the
+  existing record, rows without one are inserted.
+  """
+  if fmt is None:
+     fmt = 'jsonl' if source.name.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+  try:
+     summary = bulk_import.import_file(kind, source, fmt=fmt, rejects=rejects)
+  except bulk_import.BulkImportError as e:
+     raise click.ClickException(str(e))
+
+  page_cache.invalidate(*IMPORT_INVALIDATES[kind])
+  click.echo(
+     f"{summary['kind']}: {summary['rows']} rows, {summary['inserted']} inserted, "
+     f"{summary['updated']} updated, {summary['rejected']} rejected "
+     f"in {summary['seconds']:.2f}s ({summary['rows_per_second']:.0f} rows/s)"
+  )
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(list(bulk_export.MODELS)))
+@click.argument('dest', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'parquet']),
+              help='Output format. Defaults to parquet for .parquet files, csv otherwise.')
+@click.option('--batch-size', type=int, default=None,
+              help='Rows fetched and written per batch. Defaults to EXPORT_BATCH_SIZE.')
+def export_command(kind, dest, fmt, batch_size):
+  """Export venues, artists or shows to CSV (use - for stdout) or Parquet."""
+  batch_size = batch_size or current_app.config['EXPORT_BATCH_SIZE']
+  use_statement_timeout('export')
+  if fmt is None:
+     fmt = 'parquet' if dest.endswith('.parquet') else 'csv'
+
+  if fmt == 'parquet':
+     try:
+        rows = bulk_export.write_parquet(kind, dest, batch_size)
+     except RuntimeError as e:
+        raise click.ClickException(str(e))
+  else:
+     with click.open_file(dest, 'w', encoding='utf-8') as out:
+        rows = bulk_export.write_csv(kind, out, batch_size)
+
+  click.echo(f'{kind}: {rows} rows exported to {dest}', err=True)
+
+@bp.cli.command('age-show-counts')
+@click.option('--rebuild', is_flag=True, help='Recompute every counter from the Show table.')
+def age_show_counts_command(rebuild):
+  """Move shows that have started from the upcoming to the past counters.
+
+  Meant to run every minute or so from cron; the listing pages read their
+  upcoming show counts from these counters.
+  """
+  if rebuild:
+     show_counts.rebuild()
+     click.echo('Upcoming show counters rebuilt.')
+  else:
+     moved = show_counts.age()
+     click.echo(f'{moved} shows moved from upcoming to past.')
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -705,11 +1349,11 @@ if not app.debug:
 
 # Default port:
 if __name__ == '__main__':
-    app.run()
+    create_app().run()
 
 # Or specify port manually:
 '''
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
 '''
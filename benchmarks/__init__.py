@@ -0,0 +1,8 @@
+"""Synthetic data seeding and per-route benchmarks for the Fyyur app.
+
+Both run against the database in DATABASE_URL (a local Postgres):
+
+    python -m benchmarks.seed --scale 100k
+    python -m benchmarks.bench --out reports/100k.json
+    python -m benchmarks.bench --out reports/after.json --baseline reports/100k.json
+"""
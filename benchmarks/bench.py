@@ -0,0 +1,312 @@
+"""Per-route latency, query count and memory benchmarks.
+
+Every route in app.py is requested through the Flask test client against
+the database in DATABASE_URL (seed it first with benchmarks.seed). For each
+route the report records latency percentiles over --requests timed runs,
+the number of SQL statements one request issues, and the peak Python
+memory allocated while serving it. The page cache is off unless --cache is
+given, so the numbers measure the database and templates.
+
+Write routes add rows and only run with --include-writes. Full table
+exports are slow at the larger scales and only run with --include-exports.
+"""
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+import click
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+class Route:
+    """One benchmarked request."""
+
+    def __init__(self, name, path, method='GET', data=None, writes=False, export=False):
+        self.name = name
+        self.path = path
+        self.method = method
+        self.data = data
+        self.writes = writes
+        self.export = export
+
+    def request(self, client):
+        response = client.open(self.path, method=self.method, data=self.data)
+        # Streamed bodies are only produced when read
+        response.get_data()
+        response.close()
+        return response
+
+
+class QueryCounter:
+    """Counts statements sent to any of the app's engines."""
+
+    def __init__(self, engines):
+        self.count = 0
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def deep_cursor(app_module, query, columns, fraction=0.9):
+    """Cursor for the row `fraction` of the way through `query`, to time deep pages."""
+    row = query.order_by(*columns).offset(int(query.count() * fraction)).limit(1).first()
+    return app_module.encode_cursor(row, columns) if row else ''
+
+
+def sample_routes(app_module):
+    """Routes for every view in app.py, using ids and names found in the database."""
+    from models import db, Venue, Artist, Show
+
+    venue = db.session.scalars(db.select(Venue).order_by(Venue.id).limit(1)).first()
+    artist = db.session.scalars(db.select(Artist).order_by(Artist.id).limit(1)).first()
+    if venue is None or artist is None:
+        raise click.ClickException('The database is empty, seed it first: python -m benchmarks.seed')
+
+    # The busiest venue and artist have the most show history to render
+    busy_venue = db.session.scalar(
+        db.select(Show.venue_id).group_by(Show.venue_id).order_by(db.func.count().desc()).limit(1)
+    ) or venue.id
+    busy_artist = db.session.scalar(
+        db.select(Show.artist_id).group_by(Show.artist_id).order_by(db.func.count().desc()).limit(1)
+    ) or artist.id
+
+    area_cursor = deep_cursor(app_module, db.session.query(Venue.state, Venue.city).distinct(),
+                              [Venue.state, Venue.city])
+    artist_cursor = deep_cursor(app_module, db.session.query(Artist.id), [Artist.id])
+    show_cursor = deep_cursor(app_module, db.session.query(Show.start_time, Show.id), [Show.start_time, Show.id])
+
+    search_term = venue.name.split()[1]
+    month_ago = (datetime.now() - timedelta(days=30)).isoformat(timespec='seconds')
+    next_month = (datetime.now() + timedelta(days=30)).isoformat(timespec='seconds')
+    genre = (venue.genres or ['Jazz'])[0]
+    # An evening a week from now, for the availability search
+    evening = datetime.now().replace(hour=20, minute=0, second=0, microsecond=0) + timedelta(days=7)
+    evening_start = evening.isoformat(timespec='minutes')
+    evening_end = (evening + timedelta(hours=3)).isoformat(timespec='minutes')
+
+    venue_form = {
+        'name': 'Benchmark Venue', 'city': venue.city, 'state': venue.state, 'address': '1 Benchmark Way',
+        'phone': '555-555-5555', 'genres': [genre], 'image_link': 'https://images.example.com/bench.jpg',
+        'facebook_link': 'https://www.facebook.com/bench', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }
+    artist_form = {
+        'name': 'Benchmark Artist', 'city': artist.city, 'state': artist.state, 'phone': '555-555-5555',
+        'genres': [genre], 'image_link': 'https://images.example.com/bench.jpg',
+        'facebook_link': 'https://www.facebook.com/bench', 'website_link': 'https://bench.example.com',
+        'seeking_description': '',
+    }
+    show_form = {
+        'artist_id': str(artist.id), 'venue_id': str(venue.id),
+        'start_time': (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+    routes = [
+        Route('index', '/'),
+        Route('venues', '/venues'),
+        Route('venues_deep_page', f'/venues?after={area_cursor}'),
+        Route('venues_max_page', '/venues?limit=200'),
+        Route('venues_genre', f'/venues?genre={genre}'),
+        Route('venues_state', f'/venues?state={venue.state}'),
+        Route('venues_area', '/venues?' + urlencode({'state': venue.state, 'city': venue.city})),
+        Route('artists', '/artists'),
+        Route('artists_deep_page', f'/artists?after={artist_cursor}'),
+        Route('shows', '/shows'),
+        Route('shows_deep_page', f'/shows?after={show_cursor}'),
+        Route('search_venues', '/venues/search', 'POST', {'search_term': search_term}),
+        Route('search_artists', '/artists/search', 'POST', {'search_term': search_term}),
+        Route('search_venues_short', '/venues/search', 'POST', {'search_term': 'a'}),
+        Route('show_venue', f'/venues/{venue.id}'),
+        Route('show_venue_busiest', f'/venues/{busy_venue}'),
+        Route('show_artist', f'/artists/{artist.id}'),
+        Route('show_artist_busiest', f'/artists/{busy_artist}'),
+        Route('venue_shows_upcoming', f'/venues/{busy_venue}/shows/upcoming'),
+        Route('venue_shows_past', f'/venues/{busy_venue}/shows/past'),
+        Route('artist_shows_upcoming', f'/artists/{busy_artist}/shows/upcoming'),
+        Route('artist_shows_past', f'/artists/{busy_artist}/shows/past'),
+        Route('edit_venue', f'/venues/{venue.id}/edit'),
+        Route('edit_artist', f'/artists/{artist.id}/edit'),
+        Route('create_venue_form', '/venues/create'),
+        Route('create_artist_form', '/artists/create'),
+        Route('create_show_form', '/shows/create'),
+        Route('api_venues_city', '/api/venues?' + urlencode({'city': venue.city})),
+        Route('api_artists_genre', f'/api/artists?genre={genre}'),
+        Route('api_shows_month', f'/api/shows?start_after={month_ago}&start_before={next_month}'),
+        Route('api_shows_venue', f'/api/shows?venue_id={busy_venue}'),
+        Route('api_venues_available', f'/api/venues/available?state={venue.state}&start={evening_start}&end={evening_end}'),
+        Route('api_venue_genres', f'/api/venues/genres?state={venue.state}'),
+        Route('api_artist_genres', '/api/artists/genres'),
+        Route('api_pool', '/api/pool'),
+        Route('not_found', '/venues/0'),
+        Route('create_venue', '/venues/create', 'POST', venue_form, writes=True),
+        Route('create_artist', '/artists/create', 'POST', artist_form, writes=True),
+        Route('create_show', '/shows/create', 'POST', show_form, writes=True),
+        Route('edit_venue_submission', f'/venues/{venue.id}/edit', 'POST', venue_form, writes=True),
+        Route('edit_artist_submission', f'/artists/{artist.id}/edit', 'POST', artist_form, writes=True),
+        Route('export_venues', '/export/venues.csv', export=True),
+        Route('export_artists', '/export/artists.csv', export=True),
+        Route('export_shows', '/export/shows.csv', export=True),
+    ]
+    return routes
+
+
+def measure(client, counter, route, requests, warmup):
+    """Time `route` and return its stats dict."""
+    for _ in range(warmup):
+        route.request(client)
+
+    timings = []
+    queries = []
+    status = None
+    for _ in range(requests):
+        before = counter.count
+        started = time.perf_counter()
+        status = route.request(client).status_code
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count - before)
+
+    # Tracing slows requests down a lot, so memory gets its own untimed run
+    tracemalloc.start()
+    route.request(client)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'method': route.method,
+        'path': route.path,
+        'status': status,
+        'requests': requests,
+        'latency_ms': {
+            'p50': percentile(timings, 0.50),
+            'p90': percentile(timings, 0.90),
+            'p99': percentile(timings, 0.99),
+            'mean': statistics.fmean(timings),
+            'max': timings[-1],
+        },
+        'queries': max(queries),
+        'peak_memory_kib': peak / 1024,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def row_counts():
+    from models import db, Venue, Artist, Show
+    return {
+        model.__tablename__: db.session.scalar(db.select(db.func.count()).select_from(model))
+        for model in (Venue, Artist, Show)
+    }
+
+
+def compare(report, baseline):
+    """Print the p50 latency and query count change of each route against `baseline`."""
+    previous = baseline['routes']
+    click.echo(f"\n{'route':<26}{'p50 ms':>10}{'was':>10}{'change':>9}{'queries':>9}{'was':>6}")
+    for name, stats in report['routes'].items():
+        if name not in previous:
+            continue
+        p50 = stats['latency_ms']['p50']
+        was = previous[name]['latency_ms']['p50']
+        change = f'{(p50 - was) / was * 100:+.0f}%' if was else ''
+        click.echo(
+            f"{name:<26}{p50:>10.1f}{was:>10.1f}{change:>9}{stats['queries']:>9}{previous[name]['queries']:>6}"
+        )
+
+
+@click.command()
+@click.option('--out', type=click.Path(dir_okay=False, writable=True), default='benchmark.json', show_default=True,
+              help='Where to write the JSON report.')
+@click.option('--requests', 'requests', type=int, default=20, show_default=True, help='Timed requests per route.')
+@click.option('--warmup', type=int, default=2, show_default=True, help='Untimed requests per route first.')
+@click.option('--route', 'only', multiple=True, help='Only run the named routes (repeatable).')
+@click.option('--include-writes', is_flag=True, help='Also run the create and edit submissions (adds rows).')
+@click.option('--include-exports', is_flag=True, help='Also run the full-table CSV exports.')
+@click.option('--cache', is_flag=True, help='Leave the page cache on.')
+@click.option('--baseline', type=click.File('r'), help='Earlier report to compare against.')
+def main(out, requests, warmup, only, include_writes, include_exports, cache, baseline):
+    """Benchmark every route of the app against the database in DATABASE_URL."""
+    import app as app_module
+    from models import db
+
+    app = app_module.create_app()
+    app.config['WTF_CSRF_ENABLED'] = False
+    if not cache:
+        app_module.page_cache.backend = None
+
+    with app.app_context():
+        url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        if url.get_backend_name() != 'postgresql':
+            raise click.ClickException('Benchmarks run against PostgreSQL, set DATABASE_URL')
+
+        counter = QueryCounter(db.engines.values())
+        routes = sample_routes(app_module)
+        counts = row_counts()
+        db.session.remove()
+
+    routes = [
+        route for route in routes
+        if (not only or route.name in only)
+        and (include_writes or not route.writes)
+        and (include_exports or not route.export)
+    ]
+
+    report = {
+        'meta': {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'database': url.render_as_string(hide_password=True),
+            'rows': counts,
+            'python': platform.python_version(),
+            'requests': requests,
+            'warmup': warmup,
+            'page_cache': cache,
+        },
+        'routes': {},
+    }
+
+    client = app.test_client()
+    click.echo(f"{'route':<26}{'status':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KiB':>10}")
+    for route in routes:
+        stats = measure(client, counter, route, requests, warmup)
+        report['routes'][route.name] = stats
+        latency = stats['latency_ms']
+        click.echo(
+            f"{route.name:<26}{stats['status']:>7}{latency['p50']:>10.1f}{latency['p90']:>10.1f}"
+            f"{latency['p99']:>10.1f}{stats['queries']:>9}{stats['peak_memory_kib']:>10.0f}"
+        )
+
+    with open(out, 'w', encoding='utf-8') as handle:
+        json.dump(report, handle, indent=2)
+    click.echo(f'\nReport written to {out}')
+
+    if baseline:
+        compare(report, json.load(baseline))
+
+
+if __name__ == '__main__':
+    main()
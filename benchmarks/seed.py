@@ -0,0 +1,193 @@
+"""Generate a realistic synthetic catalog and bulk load it.
+
+Venue, artist and show counts scale with --scale. Cities, genres and
+bookings follow skewed (Zipf-like) distributions, so a few big cities and
+busy venues dominate the way they do in real data. Shows spread over two
+years either side of now, without double-booking a venue or an artist.
+Rows are written to temporary CSV files and loaded with the same COPY path
+as `flask import`.
+"""
+import csv
+import itertools
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta
+
+import click
+
+# Number of shows per scale; venues and artists are derived from it
+SCALES = {
+    '1k': 1_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+
+CITIES = [
+    ('New York', 'NY'), ('Los Angeles', 'CA'), ('Chicago', 'IL'), ('Houston', 'TX'),
+    ('Phoenix', 'AZ'), ('Philadelphia', 'PA'), ('San Antonio', 'TX'), ('San Diego', 'CA'),
+    ('Dallas', 'TX'), ('Austin', 'TX'), ('San Francisco', 'CA'), ('Seattle', 'WA'),
+    ('Denver', 'CO'), ('Nashville', 'TN'), ('Boston', 'MA'), ('Portland', 'OR'),
+    ('Las Vegas', 'NV'), ('Atlanta', 'GA'), ('Miami', 'FL'), ('New Orleans', 'LA'),
+    ('Minneapolis', 'MN'), ('Detroit', 'MI'), ('Baltimore', 'MD'), ('Pittsburgh', 'PA'),
+    ('Kansas City', 'MO'), ('Columbus', 'OH'), ('Raleigh', 'NC'), ('Salt Lake City', 'UT'),
+    ('Albuquerque', 'NM'), ('Boise', 'ID'),
+]
+
+WORDS = [
+    'Blue', 'Red', 'Velvet', 'Golden', 'Electric', 'Silver', 'Midnight', 'Rusty', 'Neon',
+    'Crystal', 'Wild', 'Hollow', 'Iron', 'Lucky', 'Broken', 'Echo', 'Paper', 'Stone',
+    'Moon', 'Sun', 'River', 'Fox', 'Owl', 'Crow', 'Harbor', 'Garden', 'Lantern', 'Anchor',
+]
+VENUE_KINDS = ['Hall', 'Room', 'Lounge', 'Theatre', 'Club', 'Tavern', 'Ballroom', 'Garage', 'Cellar']
+ARTIST_KINDS = ['Band', 'Collective', 'Trio', 'Quartet', 'Orchestra', 'Project', 'Brothers', 'Sisters', '']
+
+
+def genre_choices():
+    """The genre list offered by the forms."""
+    from forms import VenueForm
+    return [value for value, _ in VenueForm.genres.kwargs['choices']]
+
+
+def zipf_weights(count, skew=1.1):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def fancy_name(rng, kinds, serial):
+    kind = rng.choice(kinds)
+    name = f'The {rng.choice(WORDS)} {rng.choice(WORDS)}'
+    return f'{name} {kind} {serial}'.replace('  ', ' ')
+
+
+def venue_rows(rng, count, genres):
+    cities = rng.choices(CITIES, weights=zipf_weights(len(CITIES)), k=count)
+    for serial, (city, state) in enumerate(cities, start=1):
+        yield {
+            'name': fancy_name(rng, VENUE_KINDS, serial),
+            'city': city,
+            'state': state,
+            'address': f'{rng.randint(1, 9999)} {rng.choice(WORDS)} St',
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'genres': ','.join(rng.sample(genres, rng.randint(1, 4))),
+            'image_link': f'https://images.example.com/venues/{serial}.jpg',
+            'facebook_link': f'https://www.facebook.com/venue{serial}',
+            'website_link': f'https://venue{serial}.example.com',
+            'looking_for_talent': rng.random() < 0.4,
+            'seeking_description': 'Looking for local acts on weeknights.' if rng.random() < 0.4 else '',
+        }
+
+
+def artist_rows(rng, count, genres):
+    cities = rng.choices(CITIES, weights=zipf_weights(len(CITIES)), k=count)
+    for serial, (city, state) in enumerate(cities, start=1):
+        yield {
+            'name': fancy_name(rng, ARTIST_KINDS, serial),
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'genres': ','.join(rng.sample(genres, rng.randint(1, 3))),
+            'image_link': f'https://images.example.com/artists/{serial}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{serial}',
+            'website_link': f'https://artist{serial}.example.com',
+            'looking_for_venues': rng.random() < 0.5,
+            'seeking_description': 'Touring this season, open to bookings.' if rng.random() < 0.3 else '',
+        }
+
+
+def show_rows(rng, count, venue_ids, artist_ids):
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    # Popular venues and artists get most of the bookings
+    venue_picks = rng.choices(venue_ids, weights=zipf_weights(len(venue_ids), skew=0.8), k=count)
+    artist_picks = rng.choices(artist_ids, weights=zipf_weights(len(artist_ids), skew=0.8), k=count)
+    # (id, day, hour) of every start so far. Shows run the default two hours,
+    # so a start an hour either side clashes and the import would reject it
+    venue_booked, artist_booked = set(), set()
+
+    def free(booked, owner, day, hour):
+        return all((owner, day, h) not in booked for h in (hour - 1, hour, hour + 1))
+
+    for venue_id, artist_id in zip(venue_picks, artist_picks):
+        # Evening start times within two years either side of now
+        for _ in range(20):
+            day = rng.randint(-730, 730)
+            hour = rng.choice([18, 19, 20, 20, 21, 21, 22])
+            if free(venue_booked, venue_id, day, hour) and free(artist_booked, artist_id, day, hour):
+                break
+        else:
+            # No free evening found for this pair, leave the show out
+            continue
+        venue_booked.add((venue_id, day, hour))
+        artist_booked.add((artist_id, day, hour))
+        yield {
+            'venue_id': venue_id,
+            'artist_id': artist_id,
+            'start_time': (now + timedelta(days=day)).replace(hour=hour).isoformat(sep=' '),
+        }
+
+
+def load(kind, rows):
+    """Write `rows` to a temporary CSV file and bulk load it. Returns the import summary."""
+    import bulk_import
+
+    rows = iter(rows)
+    first = next(rows)
+    with tempfile.NamedTemporaryFile('w+', suffix='.csv', encoding='utf-8', newline='', delete=False) as handle:
+        path = handle.name
+        writer = csv.DictWriter(handle, fieldnames=list(first))
+        writer.writeheader()
+        writer.writerows(itertools.chain([first], rows))
+    try:
+        with open(path, encoding='utf-8', newline='') as source:
+            return bulk_import.import_file(kind, source)
+    finally:
+        os.unlink(path)
+
+
+def seed(scale, seed_value=42, truncate=False):
+    """Generate and load a catalog for `scale`. Returns the import summaries."""
+    from models import db, Venue, Artist
+    import show_counts
+
+    shows = SCALES[scale]
+    venues = max(shows // 20, 10)
+    artists = max(shows // 10, 10)
+    rng = random.Random(seed_value)
+    genres = genre_choices()
+
+    if truncate:
+        db.session.execute(db.text('TRUNCATE "Show", "Venue", "Artist" RESTART IDENTITY CASCADE'))
+        db.session.commit()
+
+    summaries = [
+        load('venues', venue_rows(rng, venues, genres)),
+        load('artists', artist_rows(rng, artists, genres)),
+    ]
+    venue_ids = db.session.scalars(db.select(Venue.id)).all()
+    artist_ids = db.session.scalars(db.select(Artist.id)).all()
+    db.session.commit()
+    summaries.append(load('shows', show_rows(rng, shows, venue_ids, artist_ids)))
+
+    # Counters are incremental; after a TRUNCATE they have to be rebuilt
+    show_counts.rebuild()
+    return summaries
+
+
+@click.command()
+@click.option('--scale', type=click.Choice(list(SCALES)), default='1k', show_default=True,
+              help='Number of shows to generate; venues and artists scale with it.')
+@click.option('--seed', 'seed_value', type=int, default=42, show_default=True, help='Random seed.')
+@click.option('--truncate', is_flag=True, help='Empty the Venue, Artist and Show tables first.')
+def main(scale, seed_value, truncate):
+    """Seed the database in DATABASE_URL with a synthetic catalog."""
+    from app import create_app
+
+    with create_app().app_context():
+        for summary in seed(scale, seed_value=seed_value, truncate=truncate):
+            click.echo(
+                f"{summary['kind']}: {summary['inserted']} inserted, {summary['rejected']} rejected "
+                f"in {summary['seconds']:.1f}s ({summary['rows_per_second']:.0f} rows/s)"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Streaming export of venues, artists and shows to CSV or Parquet.
+
+Rows are read through a server-side cursor (`yield_per`) and written out in
+fixed-size batches, so memory use depends on the batch size and not on the
+size of the table. CSV output loads straight back in with `flask import`,
+which ignores the updated_at column and stamps the rows afresh.
+"""
+import csv
+import io
+
+import sqlalchemy as sa
+
+from models import db, Venue, Artist, Show
+
+MODELS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+
+def export_columns(kind):
+    """Column names of `kind`, in table order."""
+    return [column.name for column in MODELS[kind].__table__.columns]
+
+
+def iter_batches(kind, batch_size):
+    """Yield lists of at most `batch_size` row tuples, ordered by id."""
+    model = MODELS[kind]
+    statement = db.select(*model.__table__.columns).order_by(model.id)
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
+
+
+def csv_value(value):
+    """ARRAY values are written as comma lists, the form `flask import` reads back."""
+    if isinstance(value, list):
+        return ','.join(value)
+    return value
+
+
+def csv_chunks(kind, batch_size):
+    """Yield the CSV export of `kind` as one string per batch, header first."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_columns(kind))
+    for batch in iter_batches(kind, batch_size):
+        writer.writerows([csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_csv(kind, out, batch_size):
+    """Write the CSV export of `kind` to the text file `out`. Returns the row count."""
+    writer = csv.writer(out)
+    writer.writerow(export_columns(kind))
+    rows = 0
+    for batch in iter_batches(kind, batch_size):
+        writer.writerows([csv_value(value) for value in row] for row in batch)
+        rows += len(batch)
+    return rows
+
+
+def arrow_schema(kind, pa):
+    """Arrow schema matching the column types of `kind`."""
+    fields = []
+    for column in MODELS[kind].__table__.columns:
+        if isinstance(column.type, sa.ARRAY):
+            arrow_type = pa.list_(pa.string())
+        elif isinstance(column.type, sa.Integer):
+            arrow_type = pa.int32()
+        elif isinstance(column.type, sa.Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, sa.DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type, nullable=column.nullable))
+    return pa.schema(fields)
+
+
+def write_parquet(kind, path, batch_size):
+    """Write `kind` to a Parquet file at `path`, one row group per batch. Returns the row count.
+
+    Needs the optional pyarrow package.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Parquet export needs pyarrow: pip install pyarrow')
+
+    schema = arrow_schema(kind, pa)
+    rows = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in iter_batches(kind, batch_size):
+            columns = zip(*batch)
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                schema=schema
+            ))
+            rows += len(batch)
+    return rows
@@ -0,0 +1,403 @@
+"""Bulk loading of venues, artists and shows from CSV or JSONL files.
+
+Rows are streamed into a temporary staging table with PostgreSQL COPY, every
+value still as text. Validation then runs as a handful of set-based UPDATEs
+that tag bad rows with a reason, and the remaining rows are upserted into the
+real table in a single INSERT ... ON CONFLICT. The whole load is one
+transaction: either every valid row lands or none do.
+"""
+import csv
+import io
+import itertools
+import json
+import time
+
+import sqlalchemy as sa
+from flask import current_app
+
+from models import db, Venue, Artist, Show
+
+MODELS = {
+    'venues': Venue,
+    'artists': Artist,
+    'shows': Show,
+}
+
+# Fields the create forms insist on, enforced on imported rows too
+REQUIRED = {
+    'venues': ('name', 'city', 'state', 'address'),
+    'artists': ('name', 'city', 'state'),
+    'shows': ('artist_id', 'venue_id', 'start_time'),
+}
+
+# Foreign keys checked against the referenced table before the upsert
+FOREIGN_KEYS = {
+    'shows': (('artist_id', 'Artist'), ('venue_id', 'Venue')),
+}
+
+# Columns computed from others when a file leaves them out or blank. {name} is
+# replaced by the typed value of that column, {default_duration} by SHOW_DEFAULT_DURATION
+DERIVED = {
+    'shows': {'end_time': '{start_time} + make_interval(mins => {default_duration})'},
+}
+
+BOOLEAN_LITERALS = ('t', 'true', 'y', 'yes', 'on', '1', 'f', 'false', 'n', 'no', 'off', '0')
+
+TRY_TIMESTAMP = '''
+CREATE OR REPLACE FUNCTION pg_temp.try_timestamp(value text) RETURNS timestamp AS $$
+BEGIN
+    RETURN value::timestamp;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+'''
+
+
+class BulkImportError(Exception):
+    """Raised when an input file can't be loaded at all (as opposed to bad rows)."""
+
+
+class IteratorFile(io.TextIOBase):
+    """Read-only file object over an iterator of strings, for feeding COPY from a generator."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+# Set by the import itself. Exports include them, so a file may carry them, but they're ignored
+IGNORED = ('updated_at',)
+
+
+def importable_columns(model):
+    """Model columns an input file may provide. Row versions are always set by the import."""
+    return {column.name: column for column in model.__table__.columns if column.name not in IGNORED}
+
+
+def header_columns(kind, header):
+    """The importable columns named in `header`, in file order. Raises BulkImportError on unknown names."""
+    known = importable_columns(MODELS[kind])
+    unknown = [name for name in header if name not in known and name not in IGNORED]
+    if unknown:
+        raise BulkImportError(f'Unknown {kind} columns: {", ".join(unknown)}')
+    return {name: known[name] for name in header if name in known}
+
+
+def quote(name):
+    return f'"{name}"'
+
+
+def typed_value(column):
+    """SQL converting the staged text of `column` to its real type. Only valid for checked rows."""
+    value = f'NULLIF(btrim(s.{quote(column.name)}), \'\')'
+    if isinstance(column.type, sa.ARRAY):
+        # Accepts "Jazz,Rock", "{Jazz,Rock}" or '["Jazz", "Rock"]'
+        return (
+            f'CASE WHEN {value} IS NULL THEN NULL ELSE ARRAY('
+            f'SELECT btrim(g, \' "\') FROM unnest(string_to_array(btrim({value}, \'{{}}[] \'), \',\')) AS g '
+            f'WHERE btrim(g, \' "\') <> \'\''
+            f')::varchar(120)[] END'
+        )
+    if isinstance(column.type, sa.Integer):
+        return f'{value}::integer'
+    if isinstance(column.type, sa.Boolean):
+        return f'lower({value})::boolean'
+    if isinstance(column.type, sa.DateTime):
+        return f'pg_temp.try_timestamp({value})'
+    return value
+
+
+def derived_value(kind, name, columns):
+    """SQL computing the DERIVED column `name` of `kind` from the staged row."""
+    return DERIVED[kind][name].format(
+        default_duration=int(current_app.config['SHOW_DEFAULT_DURATION']),
+        **{column: typed_value(columns[column]) for column in REQUIRED[kind]}
+    )
+
+
+def loaded_value(kind, name, columns):
+    """SQL for the value column `name` of the staged row is loaded with, derived when left blank."""
+    if name in DERIVED.get(kind, {}):
+        derived = derived_value(kind, name, columns)
+        return f'COALESCE({typed_value(columns[name])}, {derived})' if name in columns else derived
+    return typed_value(columns[name])
+
+
+def reject_double_bookings(cursor, columns):
+    """Tag staged shows overlapping another show of the same venue or artist.
+
+    The artists and venues are locked first, in that order like the show
+    form, so a booking made meanwhile can't slip between the check and the
+    load. Rows
+    are checked against the shows already booked (served by the GiST
+    indexes on Show), then against each other: of two overlapping rows in
+    the file, the one starting later is rejected.
+    """
+    for name, table in FOREIGN_KEYS['shows']:
+        cursor.execute(
+            f'SELECT ref.id FROM {quote(table)} AS ref WHERE ref.id IN ('
+            f' SELECT {typed_value(columns[name])} FROM import_staging AS s WHERE s._reject IS NULL'
+            f') ORDER BY ref.id FOR UPDATE'
+        )
+
+    start = loaded_value('shows', 'start_time', columns)
+    end = loaded_value('shows', 'end_time', columns)
+    # An updated show doesn't conflict with its own current booking
+    same_show = f' AND ref.id IS DISTINCT FROM {typed_value(columns["id"])}' if 'id' in columns else ''
+    for name, owner in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        owner_id = typed_value(columns[name])
+        cursor.execute(
+            f'UPDATE import_staging AS s SET _reject = %s WHERE s._reject IS NULL AND EXISTS ('
+            f' SELECT 1 FROM "Show" AS ref WHERE ref.{name} = {owner_id}'
+            f' AND tsrange(ref.start_time, ref.end_time) && tsrange({start}, {end}){same_show})',
+            [f'the {owner} already has a show at that time']
+        )
+    for name, owner in (('venue_id', 'venue'), ('artist_id', 'artist')):
+        # Starts before the latest end among the rows sorted ahead of it
+        cursor.execute(
+            f'UPDATE import_staging AS s SET _reject = %s FROM ('
+            f' SELECT s._line, {start} < max({end}) OVER ('
+            f'  PARTITION BY {typed_value(columns[name])} ORDER BY {start}, s._line'
+            f'  ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING'
+            f' ) AS overlaps FROM import_staging AS s WHERE s._reject IS NULL'
+            f') AS booked WHERE booked._line = s._line AND booked.overlaps',
+            [f'the {owner} has an overlapping show earlier in the file']
+        )
+
+
+def rejection_checks(kind, columns):
+    """(condition, reason) pairs, checked in order; the first match rejects the row."""
+    checks = []
+    for name in REQUIRED[kind]:
+        if name not in columns:
+            raise BulkImportError(f'{kind} files must have a {name!r} column')
+        checks.append((f'NULLIF(btrim(s.{quote(name)}), \'\') IS NULL', f'{name} is required'))
+
+    for name, column in columns.items():
+        value = f'NULLIF(btrim(s.{quote(name)}), \'\')'
+        if isinstance(column.type, sa.Integer):
+            checks.append((f"{value} !~ '^-?[0-9]{{1,9}}$'", f'{name} is not an integer'))
+        elif isinstance(column.type, sa.Boolean):
+            literals = ', '.join(f"'{literal}'" for literal in BOOLEAN_LITERALS)
+            checks.append((f'lower({value}) NOT IN ({literals})', f'{name} is not a boolean'))
+        elif isinstance(column.type, sa.DateTime):
+            checks.append((f'{value} IS NOT NULL AND pg_temp.try_timestamp({value}) IS NULL',
+                           f'{name} is not a valid timestamp'))
+        elif isinstance(column.type, sa.String) and column.type.length:
+            checks.append((f'length({value}) > {column.type.length}',
+                           f'{name} is longer than {column.type.length} characters'))
+
+    if kind == 'shows' and 'end_time' in columns:
+        checks.append((
+            f'{typed_value(columns["end_time"])} <= {typed_value(columns["start_time"])}',
+            'end_time is not after start_time'
+        ))
+
+    for name, table in FOREIGN_KEYS.get(kind, ()):
+        checks.append((
+            f'NOT EXISTS (SELECT 1 FROM {quote(table)} AS ref WHERE ref.id = {typed_value(columns[name])})',
+            f'{name} does not exist'
+        ))
+    return checks
+
+
+def staged_rows(rows):
+    """`rows` of [reason, *values] as CSV text for COPY, produced one row at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def read_csv(stream):
+    """Header columns and the data rows re-encoded for COPY.
+
+    Each row starts with a rejection reason, set for rows with the wrong
+    number of fields, so they are reported with the other rejected rows
+    instead of aborting the load. Blank lines are skipped.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if not header:
+        raise BulkImportError('CSV file is empty')
+    header = [name.strip() for name in header]
+
+    def rows():
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(header):
+                yield [f'expected {len(header)} fields, found {len(values)}', *(None for _ in header)]
+            else:
+                yield [None, *values]
+
+    return header, IteratorFile(staged_rows(rows()))
+
+
+def parse_record(line):
+    """The JSON object on `line`, or None and the reason it can't be loaded."""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, f'invalid JSON: {e.msg}'
+    if not isinstance(record, dict):
+        return None, 'not a JSON object'
+    return record, None
+
+
+def read_jsonl(stream):
+    """Columns of the first record and the records re-encoded as CSV for COPY.
+
+    Later records are written with the same columns: missing keys become
+    NULL and unknown keys are ignored. As with read_csv, each row starts
+    with a rejection reason, set for lines that aren't a JSON object.
+    """
+    lines = ((number, line) for number, line in enumerate(stream, 1) if line.strip())
+    number, first = next(lines, (None, None))
+    if first is None:
+        raise BulkImportError('JSONL file is empty')
+    first, reason = parse_record(first)
+    if reason:
+        # The first record names the columns, so nothing can be loaded without it
+        raise BulkImportError(f'Line {number} of the JSONL file: {reason}')
+    header = list(first)
+
+    def rows():
+        # Lazily, so the file is parsed only as fast as COPY reads it
+        records = itertools.chain([(first, None)], (parse_record(line) for _, line in lines))
+        for record, reason in records:
+            if reason:
+                yield [reason, *(None for _ in header)]
+                continue
+            values = [None]
+            for name in header:
+                value = record.get(name)
+                if isinstance(value, list):
+                    value = ','.join(str(item) for item in value)
+                elif isinstance(value, bool):
+                    value = 'true' if value else 'false'
+                values.append(value)
+            yield values
+
+    return header, IteratorFile(staged_rows(rows()))
+
+
+def import_file(kind, stream, fmt='csv', rejects=None):
+    """Load `stream` into the table for `kind` and return a summary dict.
+
+    `rejects`, if given, is a text file that receives every rejected row as
+    CSV with its 1-based data line number and the reason.
+    """
+    model = MODELS[kind]
+    table = model.__tablename__
+
+    header, data = read_jsonl(stream) if fmt == 'jsonl' else read_csv(stream)
+    # Every header column is staged, only these are loaded
+    columns = header_columns(kind, header)
+    checks = rejection_checks(kind, columns)
+
+    started = time.perf_counter()
+    raw = db.engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute(TRY_TIMESTAMP)
+        staged = ', '.join(f'{quote(name)} text' for name in header)
+        cursor.execute(
+            f'CREATE TEMP TABLE import_staging ('
+            f'_line bigint GENERATED ALWAYS AS IDENTITY, _reject text, {staged}'
+            f') ON COMMIT DROP'
+        )
+        column_list = ', '.join(quote(name) for name in header)
+        # Rows lead with the reason a line couldn't be parsed, see read_csv and read_jsonl
+        cursor.copy_expert(f'COPY import_staging (_reject, {column_list}) FROM STDIN WITH (FORMAT csv)', data)
+
+        # Tag invalid rows with the first failing check
+        reason = ' '.join(f'WHEN {condition} THEN %s' for condition, _ in checks)
+        cursor.execute(
+            f'UPDATE import_staging AS s SET _reject = CASE {reason} END WHERE s._reject IS NULL',
+            [message for _, message in checks]
+        )
+        if 'id' in columns:
+            # Only the last occurrence of an id in the file is loaded
+            cursor.execute(
+                'UPDATE import_staging AS s SET _reject = %s '
+                'WHERE s._reject IS NULL AND NULLIF(btrim(s.id), \'\') IS NOT NULL AND EXISTS ('
+                ' SELECT 1 FROM import_staging AS later WHERE later._reject IS NULL'
+                ' AND btrim(later.id) = btrim(s.id) AND later._line > s._line)',
+                ['id is repeated later in the file']
+            )
+        if kind == 'shows':
+            reject_double_bookings(cursor, columns)
+
+        # Rows without an id take the next value of the table's sequence
+        sequence = f'pg_get_serial_sequence(\'{quote(table)}\', \'id\')'
+        targets = ['id'] + [name for name in columns if name != 'id']
+        values = [f'COALESCE({typed_value(columns["id"])}, nextval({sequence}))' if 'id' in columns
+                  else f'nextval({sequence})']
+        targets += [name for name in DERIVED.get(kind, {}) if name not in columns]
+        values += [loaded_value(kind, name, columns) for name in targets[1:]]
+        targets.append('updated_at')
+        values.append("timezone('utc', now())")
+        updates = ', '.join(f'{quote(name)} = EXCLUDED.{quote(name)}' for name in targets if name != 'id')
+        cursor.execute(
+            f'WITH upserted AS ('
+            f' INSERT INTO {quote(table)} ({", ".join(quote(name) for name in targets)})'
+            f' SELECT {", ".join(values)} FROM import_staging AS s WHERE s._reject IS NULL ORDER BY s._line'
+            f' ON CONFLICT (id) DO UPDATE SET {updates}'
+            f' RETURNING (xmax = 0) AS inserted'
+            f') SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted'
+        )
+        inserted, updated = cursor.fetchone()
+
+        if 'id' in columns:
+            # Explicit ids may have overtaken the sequence
+            cursor.execute(f'SELECT setval({sequence}, (SELECT COALESCE(max(id), 1) FROM {quote(table)}))')
+
+        cursor.execute(
+            f'SELECT _line, _reject, {column_list} FROM import_staging WHERE _reject IS NOT NULL ORDER BY _line'
+        )
+        rejected = 0
+        writer = csv.writer(rejects) if rejects is not None else None
+        if writer:
+            writer.writerow(['line', 'reason', *header])
+        for row in cursor:
+            rejected += 1
+            if writer:
+                writer.writerow(row)
+
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    elapsed = time.perf_counter() - started
+    total = inserted + updated + rejected
+    return {
+        'kind': kind,
+        'rows': total,
+        'inserted': inserted,
+        'updated': updated,
+        'rejected': rejected,
+        'seconds': elapsed,
+        'rows_per_second': total / elapsed if elapsed else float(total),
+    }
@@ -0,0 +1,186 @@
+"""Rendered-page cache for the Fyyur listing pages."""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from blinker import Namespace
+from flask import Response, g, request, session
+
+from database import primary_window_open
+
+# Sent with namespace= and hit= on every lookup, for metrics
+cache_lookup = Namespace().signal('page-cache-lookup')
+
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL. Safe to share between threads."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete_namespace(self, namespace):
+        prefix = f'{namespace}:'
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(prefix)]:
+                del self._entries[key]
+
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file, shared by every worker on the host.
+
+    Each thread keeps its own connection. Expired rows are ignored on read
+    and swept whenever a namespace is invalidated.
+    """
+
+    def __init__(self, path, ttl=60):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS page_cache ('
+                ' key TEXT PRIMARY KEY, namespace TEXT NOT NULL,'
+                ' value BLOB NOT NULL, expires REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_page_cache_namespace ON page_cache (namespace)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        # Connections don't survive a fork, so reconnect in each worker process
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM page_cache WHERE key = ? AND expires >= ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        namespace = key.split(':', 1)[0]
+        self._connect().execute(
+            'INSERT OR REPLACE INTO page_cache (key, namespace, value, expires) VALUES (?, ?, ?, ?)',
+            (key, namespace, value, time.time() + self.ttl)
+        )
+
+    def delete_namespace(self, namespace):
+        conn = self._connect()
+        conn.execute('DELETE FROM page_cache WHERE namespace = ? OR expires < ?', (namespace, time.time()))
+
+
+class PageCache:
+    """Caches rendered pages keyed by route and query string.
+
+    Views opt in with the `cached` decorator, naming the namespace their
+    output depends on. Write handlers call `invalidate` with the namespaces
+    they affect once their transaction has committed.
+
+    Configured with PAGE_CACHE_BACKEND ('memory', 'sqlite' or None to turn
+    caching off), PAGE_CACHE_TTL, PAGE_CACHE_SIZE and PAGE_CACHE_PATH.
+
+    A client that has just written bypasses the cache for
+    READ_YOUR_WRITES_SECONDS, as other workers may still hold pages from
+    before its write. For as long after an invalidation, pages read from a
+    replica are served but not stored, since the replica may lag.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.replica_lag = 10
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('PAGE_CACHE_BACKEND')
+        ttl = app.config.get('PAGE_CACHE_TTL', 60)
+        self.replica_lag = app.config.get('READ_YOUR_WRITES_SECONDS', 10)
+        if backend == 'memory':
+            self.backend = LRUCache(maxsize=app.config.get('PAGE_CACHE_SIZE', 1024), ttl=ttl)
+        elif backend == 'sqlite':
+            self.backend = SQLiteCache(app.config['PAGE_CACHE_PATH'], ttl=ttl)
+        elif backend:
+            raise ValueError(f'Unknown PAGE_CACHE_BACKEND {backend!r}')
+        app.extensions['page_cache'] = self
+
+    def cached(self, namespace):
+        """Serve the decorated GET view from the cache, storing successful renders."""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                # Pages carrying flashed messages are specific to one visitor
+                if self.backend is None or session.get('_flashes') or primary_window_open():
+                    return view(*args, **kwargs)
+
+                key = f'{namespace}:{request.full_path}'
+                body = self.backend.get(key)
+                cache_lookup.send(self, namespace=namespace, hit=body is not None)
+                if body is not None:
+                    return Response(body, mimetype='text/html')
+
+                rv = view(*args, **kwargs)
+                if isinstance(rv, str) and not self.replica_may_lag(namespace):
+                    self.backend.set(key, rv.encode())
+                return rv
+            return wrapper
+        return decorator
+
+    def memoize(self, namespace, key, compute):
+        """Return `compute()`, cached as JSON in `namespace` under `key` until the namespace is invalidated."""
+        if self.backend is None or primary_window_open():
+            return compute()
+        key = f'{namespace}:{key}'
+        value = self.backend.get(key)
+        cache_lookup.send(self, namespace=namespace, hit=value is not None)
+        if value is not None:
+            return json.loads(value)
+        value = compute()
+        if not self.replica_may_lag(namespace):
+            self.backend.set(key, json.dumps(value).encode())
+        return value
+
+    def replica_may_lag(self, namespace):
+        """Whether this request read from a replica within `replica_lag` seconds of `namespace` being invalidated."""
+        if g.get('db_replica') is None:
+            return False
+        invalidated = self.backend.get(f'invalidated:{namespace}')
+        return invalidated is not None and time.time() - float(invalidated) < self.replica_lag
+
+    def invalidate(self, *namespaces):
+        """Drop every cached page in the given namespaces."""
+        if self.backend is None:
+            return
+        for namespace in namespaces:
+            # Kept in the backend, so with the sqlite backend every worker sees it
+            self.backend.set(f'invalidated:{namespace}', str(time.time()).encode())
+            self.backend.delete_namespace(namespace)
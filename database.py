@@ -0,0 +1,196 @@
+"""Engine configuration: pooling, statement timeouts and read-replica routing."""
+import os
+import random
+import threading
+import time
+
+from blinker import Namespace
+from flask import current_app, g, has_app_context, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc
+from sqlalchemy.pool import NullPool, QueuePool
+
+# Sent with seconds= and timed_out= after every pool checkout, for metrics
+checkout_waited = Namespace().signal('pool-checkout-waited')
+
+
+class PoolStats:
+    """Running totals of how long connection checkouts waited on the pool."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+
+    def record(self, seconds, timed_out=False):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+        checkout_waited.send(self, seconds=seconds, timed_out=timed_out)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_wait_seconds_total': self.wait_total,
+                'checkout_wait_seconds_max': self.wait_max,
+                'checkout_timeouts': self.timeouts,
+            }
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a free connection.
+
+    Timed around connect() rather than _do_get(), which QueuePool calls again
+    when it retries, so each checkout is recorded once. Only pool exhaustion
+    counts as a timeout; a failure to reach the database is not recorded.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_stats.record(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings in config.py.
+
+    Behind PgBouncer in transaction mode the app keeps no pool of its own
+    (PgBouncer is the pool), so NullPool is used and the sizing settings
+    don't apply.
+    """
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+    if config['DB_PGBOUNCER']:
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+        )
+    return options
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the read replica chosen for the current request.
+
+    Flushes always go to the primary, as does everything outside a request
+    routed to a replica (write handlers, CLI commands).
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_read(view):
+    """Mark a view as read-only, so it may be served from a read replica."""
+    view.replica_read = True
+    return view
+
+
+def statement_timeout(route_class):
+    """Mark a view as belonging to a STATEMENT_TIMEOUTS route class, e.g. 'search' or 'export'."""
+    def decorator(view):
+        view.statement_timeout_class = route_class
+        return view
+    return decorator
+
+
+def primary_window_open():
+    """Whether the current client wrote recently enough that it must not be shown replica or cached reads."""
+    return has_request_context() and session.get('_primary_until', 0) >= time.time()
+
+
+def use_statement_timeout(route_class):
+    """Apply the timeout of `route_class` to transactions begun from now on in this context."""
+    g.statement_timeout_class = route_class
+
+
+def init_app(app, db):
+    """Wire pool sizing, per-route statement timeouts and replica routing into `app`.
+
+    Call before `db.init_app(app)`, which creates the engine from the options.
+    """
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(engine_options(app.config))
+
+    # Replicas are the binds named replica_*, see DATABASE_REPLICA_URLS
+    replicas = [key for key in app.config.get('SQLALCHEMY_BINDS') or {} if key.startswith('replica_')]
+
+    @app.before_request
+    def select_statement_timeout():
+        view = app.view_functions.get(request.endpoint)
+        use_statement_timeout(getattr(view, 'statement_timeout_class', 'default'))
+
+    @app.before_request
+    def select_replica():
+        view = app.view_functions.get(request.endpoint)
+        # Right after a write the client reads from the primary, so it sees its own change
+        if replicas and getattr(view, 'replica_read', False) and not primary_window_open():
+            g.db_replica = random.choice(replicas)
+
+    @app.after_request
+    def open_read_your_writes_window(response):
+        # Opened with or without replicas: the page cache is skipped in the window too
+        view = app.view_functions.get(request.endpoint)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and not getattr(view, 'replica_read', False):
+            session['_primary_until'] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+        return response
+
+    if not event.contains(db.session, 'after_begin', set_statement_timeout):
+        event.listen(db.session, 'after_begin', set_statement_timeout)
+
+    # Connections pooled before a fork (say by a gunicorn master with preload_app) are
+    # shared with the parent. Each child drops them without closing and opens its own.
+    os.register_at_fork(after_in_child=lambda: dispose_engines(app, db))
+
+
+def set_statement_timeout(db_session, transaction, connection):
+    # SET LOCAL lasts only for this transaction, which keeps it safe behind PgBouncer
+    if connection.dialect.name != 'postgresql' or not has_app_context():
+        return
+    timeouts = current_app.config['STATEMENT_TIMEOUTS']
+    route_class = g.get('statement_timeout_class', 'default')
+    timeout = int(timeouts.get(route_class, timeouts['default']))
+    connection.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout}')
+
+
+def dispose_engines(app, db):
+    """Forget the pooled connections of every engine of `app`, leaving them open for the parent."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def pool_status(db):
+    """Pool occupancy and checkout wait totals for the current process."""
+    pool = db.engine.pool
+    status = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    status.update(pool_stats.snapshot())
+    return status
@@ -0,0 +1,30 @@
+"""Gunicorn settings, read automatically when gunicorn is started from this directory."""
+import glob
+import os
+
+# Workers write their Prometheus metrics here for /metrics to sum up. Set
+# before the app (and prometheus_client) is imported, which preload_app
+# does right after this file is read.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.prometheus')
+)
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+wsgi_app = 'app:create_app()'
+
+# The master imports the app and precompiles its templates once, then forks
+# the workers, which share those pages copy-on-write. Each worker drops the
+# master's pooled connections after the fork, see database.init_app.
+preload_app = True
+
+
+def on_starting(server):
+    # Once per server start, not on reload: files of a previous run would be summed in
+    for path in glob.glob(os.path.join(os.environ['PROMETHEUS_MULTIPROC_DIR'], '*.db')):
+        os.remove(path)
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges from /metrics
+    import metrics
+    metrics.mark_process_dead(worker.pid)
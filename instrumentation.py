@@ -0,0 +1,146 @@
+"""Per-request SQL statistics: query count, database time and N+1 detection."""
+import hashlib
+import json
+import re
+import time
+from collections import Counter
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Literals and bound parameters are replaced so that statements differing only
+# in their values share a fingerprint
+PARAMETER = re.compile(r"%\(\w+\)s|%s|\?|:\w+|\$\d+")
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'(?<![\w."])-?\b\d+(?:\.\d+)?\b')
+VALUE_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneError(Exception):
+    """Raised in testing when one statement repeats more often than N_PLUS_ONE_THRESHOLD in a request."""
+
+
+class RequestStats:
+    """SQL statements run while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.fingerprints = Counter()
+        self.statements = {}
+
+    def record(self, statement, seconds):
+        fingerprint, normalized = fingerprint_statement(statement)
+        self.queries += 1
+        self.db_seconds += seconds
+        self.fingerprints[fingerprint] += 1
+        self.statements.setdefault(fingerprint, normalized)
+
+    def repeated(self, threshold):
+        """(fingerprint, count) of every statement run more than `threshold` times."""
+        return [(fingerprint, count) for fingerprint, count in self.fingerprints.most_common() if count > threshold]
+
+    def server_timing(self):
+        total = (time.perf_counter() - self.started) * 1000
+        return (
+            f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries", '
+            f'app;dur={total:.2f}'
+        )
+
+
+def normalize(statement):
+    """`statement` with its literals and parameters replaced by ?, whitespace collapsed."""
+    normalized = STRING_LITERAL.sub('?', statement)
+    normalized = PARAMETER.sub('?', normalized)
+    normalized = NUMBER_LITERAL.sub('?', normalized)
+    normalized = VALUE_LIST.sub('(?)', normalized)
+    return WHITESPACE.sub(' ', normalized).strip()
+
+
+def fingerprint_statement(statement):
+    """Short stable hash and normalized text of `statement`."""
+    normalized = normalize(statement)
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.record(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def discard_query_timer(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None and context.connection.info.get('query_started'):
+        context.connection.info['query_started'].pop()
+
+
+def init_app(app):
+    """Collect SQL statistics for each request of `app` when SQL_INSTRUMENTATION is on.
+
+    Responses get a Server-Timing header and every request logs one JSON
+    line with its totals. A statement repeated more than N_PLUS_ONE_THRESHOLD
+    times in one request is logged as a warning, or raises NPlusOneError when
+    N_PLUS_ONE_RAISE is set (the default under TESTING).
+    """
+    if not app.config.get('SQL_INSTRUMENTATION', True):
+        return
+
+    def threshold():
+        return app.config.get('N_PLUS_ONE_THRESHOLD', 5)
+
+    @app.before_request
+    def start_sql_stats():
+        g.sql_stats = RequestStats()
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = g.get('sql_stats')
+        if stats is None:
+            return response
+        response.headers['Server-Timing'] = stats.server_timing()
+        if stats.repeated(threshold()) and app.config.get('N_PLUS_ONE_RAISE', app.testing):
+            fingerprint, count = stats.repeated(threshold())[0]
+            raise NPlusOneError(
+                f'{request.method} {request.path} ran this statement {count} times: {stats.statements[fingerprint]}'
+            )
+        return response
+
+    @app.teardown_request
+    def log_sql_stats(exc):
+        # Runs after streamed responses finish, so their queries are included
+        stats = g.get('sql_stats')
+        if stats is None:
+            return
+        for fingerprint, count in stats.repeated(threshold()):
+            app.logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'fingerprint': fingerprint,
+                'count': count,
+                'statement': stats.statements[fingerprint],
+            }))
+        app.logger.info(json.dumps({
+            'event': 'sql_stats',
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'queries': stats.queries,
+            'db_ms': round(stats.db_seconds * 1000, 2),
+            'total_ms': round((time.perf_counter() - stats.started) * 1000, 2),
+            'fingerprints': dict(stats.fingerprints),
+        }))
@@ -0,0 +1,126 @@
+"""Prometheus metrics: request latency per endpoint, template render time, pool and cache stats.
+
+Under gunicorn every worker has its own counters. With PROMETHEUS_MULTIPROC_DIR
+set, each worker writes its metrics to mmap'd files there, which /metrics
+adds up on every scrape. gunicorn.conf.py sets it (to .prometheus/ unless
+already set), empties it when the server starts and clears a worker's live
+gauges when it exits.
+"""
+import os
+import time
+
+from flask import g, request, before_render_template, template_rendered
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+import database
+from cache import cache_lookup
+
+REQUESTS = Counter(
+    'fyyur_requests_total', 'Requests handled, by endpoint, method and status.',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_SECONDS = Histogram(
+    'fyyur_request_duration_seconds', 'Time spent serving a request, streamed bodies included.',
+    ['endpoint']
+)
+TEMPLATE_SECONDS = Histogram(
+    'fyyur_template_render_seconds', 'Time spent rendering a template.',
+    ['template'], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+POOL_SIZE = Gauge('fyyur_db_pool_size', 'Configured pool size, summed over live workers.', multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_pool_checked_out', 'Connections in use, summed over live workers.', multiprocess_mode='livesum'
+)
+POOL_OVERFLOW = Gauge(
+    'fyyur_db_pool_overflow', 'Connections open beyond the pool size, summed over live workers.',
+    multiprocess_mode='livesum'
+)
+POOL_CHECKOUT_SECONDS = Histogram(
+    'fyyur_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+)
+POOL_CHECKOUT_TIMEOUTS = Counter('fyyur_db_pool_checkout_timeouts_total', 'Checkouts that gave up waiting.')
+
+# Hit ratio: rate(...{result="hit"}) / rate(...) summed by namespace
+PAGE_CACHE_LOOKUPS = Counter(
+    'fyyur_page_cache_lookups_total', 'Page cache lookups, by namespace and hit or miss.',
+    ['namespace', 'result']
+)
+
+
+def multiprocess_mode():
+    return bool(os.environ.get('PROMETHEUS_MULTIPROC_DIR'))
+
+
+def exposition():
+    """Body and content type of a scrape, aggregated over all workers in multiprocess mode."""
+    if multiprocess_mode():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges of a worker that has exited. Called from gunicorn's child_exit hook."""
+    if multiprocess_mode():
+        multiprocess.mark_process_dead(pid)
+
+
+def update_pool_gauges(db):
+    status = database.pool_status(db)
+    POOL_SIZE.set(status.get('size', 0))
+    POOL_CHECKED_OUT.set(status.get('checked_out', 0))
+    POOL_OVERFLOW.set(status.get('overflow', 0))
+
+
+def init_app(app, db):
+    """Record request, template, pool and page cache metrics for `app`."""
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(exc):
+        # Runs after streamed responses finish
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, str(g.get('metrics_status', 500))).inc()
+        update_pool_gauges(db)
+
+    def start_template_timer(sender, template, context, **extra):
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+    def record_template(sender, template, context, **extra):
+        started = g.get('metrics_templates')
+        if started:
+            TEMPLATE_SECONDS.labels(template.name).observe(time.perf_counter() - started.pop())
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(record_template, app, weak=False)
+    # Process-wide signals, connected once however many apps are created
+    database.checkout_waited.connect(record_checkout)
+    cache_lookup.connect(record_cache_lookup)
+
+
+def record_checkout(sender, seconds, timed_out, **extra):
+    POOL_CHECKOUT_SECONDS.observe(seconds)
+    if timed_out:
+        POOL_CHECKOUT_TIMEOUTS.inc()
+
+
+def record_cache_lookup(sender, namespace, hit, **extra):
+    PAGE_CACHE_LOOKUPS.labels(namespace, 'hit' if hit else 'miss').inc()
@@ -0,0 +1,36 @@
+"""Add GIN indexes on Venue.genres and Artist.genres
+
+Revision ID: a6c4e9d27f13
+Revises: f3b8d21c6a94
+Create Date: 2026-10-18 16:42:05.391826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c4e9d27f13'
+down_revision = 'f3b8d21c6a94'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_Venue_genres': 'Venue',
+    'ix_Artist_genres': 'Artist',
+}
+
+
+def upgrade():
+    # Built concurrently, outside the migration transaction, so listings stay writable
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES.items():
+            op.create_index(name, table, ['genres'], unique=False, postgresql_using='gin',
+                   postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table in INDEXES.items():
+            op.drop_index(name, table_name=table,
+                   postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,39 @@
+"""Add trigram name indexes for venue and artist search
+
+Revision ID: b3e1c7d94a20
+Revises: 5a91175f1822
+Create Date: 2026-10-18 09:12:40.118274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e1c7d94a20'
+down_revision = '5a91175f1822'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm provides the gin_trgm_ops operator class, similarity() and the % operator
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    with op.batch_alter_table('Venue', schema=None) as batch_op:
+        batch_op.create_index('ix_Venue_name_trgm', ['name'], unique=False,
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+    with op.batch_alter_table('Artist', schema=None) as batch_op:
+        batch_op.create_index('ix_Artist_name_trgm', ['name'], unique=False,
+               postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('Artist', schema=None) as batch_op:
+        batch_op.drop_index('ix_Artist_name_trgm')
+
+    with op.batch_alter_table('Venue', schema=None) as batch_op:
+        batch_op.drop_index('ix_Venue_name_trgm')
+
+    # The extension is left installed, other objects may depend on it
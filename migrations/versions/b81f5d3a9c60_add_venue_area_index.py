@@ -0,0 +1,29 @@
+"""Add composite (state, city, id) index on Venue for area listings
+
+Revision ID: b81f5d3a9c60
+Revises: a6c4e9d27f13
+Create Date: 2026-10-18 17:35:48.902417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b81f5d3a9c60'
+down_revision = 'a6c4e9d27f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently, outside the migration transaction, so Venue stays writable
+    with op.get_context().autocommit_block():
+        op.create_index('ix_Venue_state_city_id', 'Venue', ['state', 'city', 'id'], unique=False,
+               postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_Venue_state_city_id', table_name='Venue',
+               postgresql_concurrently=True, if_exists=True)
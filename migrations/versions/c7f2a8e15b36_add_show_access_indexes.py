@@ -0,0 +1,38 @@
+"""Add composite indexes for Show access patterns
+
+Revision ID: c7f2a8e15b36
+Revises: b3e1c7d94a20
+Create Date: 2026-10-18 10:03:17.502961
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f2a8e15b36'
+down_revision = 'b3e1c7d94a20'
+branch_labels = None
+depends_on = None
+
+INDEXES = {
+    'ix_Show_venue_id_start_time': ['venue_id', 'start_time'],
+    'ix_Show_artist_id_start_time': ['artist_id', 'start_time'],
+    'ix_Show_start_time_id': ['start_time', 'id'],
+}
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction, so step out of
+    # the migration transaction. Writes to Show are not blocked while it builds.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'Show', columns, unique=False,
+                   postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='Show',
+                   postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,30 @@
+"""Add updated_at row versions to Venue, Artist and Show
+
+Revision ID: d84b0f6e2c51
+Revises: c7f2a8e15b36
+Create Date: 2026-10-18 11:26:54.730118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd84b0f6e2c51'
+down_revision = 'c7f2a8e15b36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are stamped with the migration time; the models set the value from then on
+    for table in ('Venue', 'Artist', 'Show'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False,
+                   server_default=sa.text("timezone('utc', now())")))
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,102 @@
+"""Add precomputed upcoming show counters for venues and artists
+
+Revision ID: e19a3c5f7b02
+Revises: d84b0f6e2c51
+Create Date: 2026-10-18 13:48:09.264710
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e19a3c5f7b02'
+down_revision = 'd84b0f6e2c51'
+branch_labels = None
+depends_on = None
+
+# Statement-level triggers with transition tables, so bulk loads adjust the
+# counters once per statement instead of once per row. Only shows starting
+# after the watermark are counted; the FOR SHARE lock serialises them with
+# the aging job, which holds the row FOR UPDATE while it moves the watermark.
+APPLY_SHOW_COUNTS = '''
+CREATE OR REPLACE FUNCTION show_counts_apply() RETURNS trigger AS $$
+DECLARE
+    watermark timestamp;
+BEGIN
+    SELECT counted_after INTO watermark FROM "ShowCounterState" WHERE id = 1 FOR SHARE;
+
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE "VenueShowCount" AS c SET upcoming_shows = c.upcoming_shows - d.shows
+        FROM (SELECT venue_id, count(*) AS shows FROM old_rows WHERE start_time > watermark GROUP BY venue_id) AS d
+        WHERE c.venue_id = d.venue_id;
+
+        UPDATE "ArtistShowCount" AS c SET upcoming_shows = c.upcoming_shows - d.shows
+        FROM (SELECT artist_id, count(*) AS shows FROM old_rows WHERE start_time > watermark GROUP BY artist_id) AS d
+        WHERE c.artist_id = d.artist_id;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO "VenueShowCount" (venue_id, upcoming_shows)
+        SELECT venue_id, count(*) FROM new_rows WHERE start_time > watermark GROUP BY venue_id
+        ON CONFLICT (venue_id) DO UPDATE SET upcoming_shows = "VenueShowCount".upcoming_shows + EXCLUDED.upcoming_shows;
+
+        INSERT INTO "ArtistShowCount" (artist_id, upcoming_shows)
+        SELECT artist_id, count(*) FROM new_rows WHERE start_time > watermark GROUP BY artist_id
+        ON CONFLICT (artist_id) DO UPDATE SET upcoming_shows = "ArtistShowCount".upcoming_shows + EXCLUDED.upcoming_shows;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+'''
+
+TRIGGERS = {
+    'show_counts_insert': 'AFTER INSERT ON "Show" REFERENCING NEW TABLE AS new_rows',
+    'show_counts_update': 'AFTER UPDATE ON "Show" REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows',
+    'show_counts_delete': 'AFTER DELETE ON "Show" REFERENCING OLD TABLE AS old_rows',
+}
+
+
+def upgrade():
+    op.create_table('VenueShowCount',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id')
+    )
+    op.create_table('ArtistShowCount',
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('artist_id')
+    )
+    op.create_table('ShowCounterState',
+    sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('counted_after', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Backfill from the current shows; the triggers take over from here
+    op.execute('INSERT INTO "ShowCounterState" (id, counted_after) VALUES (1, localtimestamp)')
+    op.execute(
+        'INSERT INTO "VenueShowCount" (venue_id, upcoming_shows) '
+        'SELECT venue_id, count(*) FROM "Show" WHERE start_time > localtimestamp GROUP BY venue_id'
+    )
+    op.execute(
+        'INSERT INTO "ArtistShowCount" (artist_id, upcoming_shows) '
+        'SELECT artist_id, count(*) FROM "Show" WHERE start_time > localtimestamp GROUP BY artist_id'
+    )
+
+    op.execute(APPLY_SHOW_COUNTS)
+    for name, timing in TRIGGERS.items():
+        op.execute(f'CREATE TRIGGER {name} {timing} FOR EACH STATEMENT EXECUTE PROCEDURE show_counts_apply()')
+
+
+def downgrade():
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name} ON "Show"')
+    op.execute('DROP FUNCTION IF EXISTS show_counts_apply()')
+    op.drop_table('ShowCounterState')
+    op.drop_table('ArtistShowCount')
+    op.drop_table('VenueShowCount')
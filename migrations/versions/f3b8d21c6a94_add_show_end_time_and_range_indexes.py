@@ -0,0 +1,57 @@
+"""Add Show.end_time and GiST range indexes for booking conflict checks
+
+Revision ID: f3b8d21c6a94
+Revises: e19a3c5f7b02
+Create Date: 2026-10-18 15:20:31.847105
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d21c6a94'
+down_revision = 'e19a3c5f7b02'
+branch_labels = None
+depends_on = None
+
+# Existing shows are given the default length, SHOW_DEFAULT_DURATION in config.py
+DEFAULT_DURATION = "interval '120 minutes'"
+
+INDEXES = {
+    'ix_Show_venue_id_during': 'venue_id',
+    'ix_Show_artist_id_during': 'artist_id',
+}
+
+
+def upgrade():
+    with op.batch_alter_table('Show', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute(f'UPDATE "Show" SET end_time = start_time + {DEFAULT_DURATION}')
+    with op.batch_alter_table('Show', schema=None) as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_check_constraint('ck_Show_end_after_start', 'end_time > start_time')
+
+    # btree_gist lets the integer id share a GiST index with the time range.
+    # Existing data may already hold double bookings, so overlaps are checked
+    # by the app rather than an exclusion constraint that would fail to build.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    with op.get_context().autocommit_block():
+        for name, column in INDEXES.items():
+            op.execute(
+                f'CREATE INDEX CONCURRENTLY IF NOT EXISTS "{name}" ON "Show" '
+                f'USING gist ({column}, tsrange(start_time, end_time))'
+            )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='Show',
+                   postgresql_concurrently=True, if_exists=True)
+
+    with op.batch_alter_table('Show', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_Show_end_after_start', type_='check')
+        batch_op.drop_column('end_time')
+
+    # The extension is left installed, other objects may depend on it
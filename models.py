@@ -1,10 +1,27 @@
+from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects.postgresql import ARRAY
 
-db = SQLAlchemy()
+from database import RoutingSession
+
+# Reads in replica_read views go to a read replica, see database.RoutingSession
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def utcnow():
+    """Naive UTC timestamp used for row versioning."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
 
 class Venue(db.Model):
     """The Venue class is constructed from the Venue table within the local db."""
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # Trigram index backing the fuzzy name search (needs the pg_trgm extension)
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Genre filters (@> and &&) on the listings and APIs
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        # Area summaries group by (state, city); drilling into an area walks (state, city, id)
+        db.Index('ix_Venue_state_city_id', 'state', 'city', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -16,23 +33,33 @@ class Venue(db.Model):
     facebook_link = db.Column(db.String(200)) # increased no. of characters allowed here in case of long link
 
     # Implementation of missing fields
-    genres = db.Column(db.ARRAY(db.String(120))) # Store genres as array of strings
+    genres = db.Column(ARRAY(db.String(120))) # Store genres as array of strings
     website_link = db.Column(db.String(200))
     looking_for_talent = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500)) # allocate a good amount of characters for the seeking description
 
-    shows = db.relationship('Show', backref='venue', lazy='joined', cascade="all, delete")
+    # Row version, bumped on every update. Feeds the detail page ETag/Last-Modified
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    # Shows are loaded on access only; routes that need them opt in with loader options
+    shows = db.relationship('Show', backref='venue', lazy='select', cascade="all, delete")
 
 class Artist(db.Model):
     """The Artist class is constructed from the Artist table within the local db."""
     __tablename__ = 'Artist'
+    __table_args__ = (
+        # Trigram index backing the fuzzy name search (needs the pg_trgm extension)
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        # Genre filters (@> and &&) on the listings and APIs
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(2)) # state is a two char string
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120))) # modify genres to be an array of strings
+    genres = db.Column(ARRAY(db.String(120))) # modify genres to be an array of strings
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(200)) # increased no. of characters allowed here in case of long link
 
@@ -41,13 +68,59 @@ class Artist(db.Model):
     looking_for_venues = db.Column(db.Boolean)
     seeking_description = db.Column(db.String(500)) # allocate a good amount of characters for the seeking description
 
-    shows = db.relationship('Show', backref='artist', lazy='joined', cascade="all, delete")
+    # Row version, bumped on every update. Feeds the detail page ETag/Last-Modified
+    updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    # Shows are loaded on access only; routes that need them opt in with loader options
+    shows = db.relationship('Show', backref='artist', lazy='select', cascade="all, delete")
 
 class Show(db.Model):
    """The Show class is constructed from the Show table within the local db."""
    __tablename__ = 'Show'
+   __table_args__ = (
+       # Upcoming/past lookups per venue or artist filter on the FK and range over start_time
+       db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+       db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+       # Keyset pagination of the /shows listing walks (start_time, id)
+       db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+       # Booking overlap checks: (venue or artist, time range) && (requested range). Needs btree_gist
+       db.Index('ix_Show_venue_id_during', 'venue_id', db.text('tsrange(start_time, end_time)'),
+                postgresql_using='gist'),
+       db.Index('ix_Show_artist_id_during', 'artist_id', db.text('tsrange(start_time, end_time)'),
+                postgresql_using='gist'),
+       db.CheckConstraint('end_time > start_time', name='ck_Show_end_after_start'),
+   )
 
    id = db.Column(db.Integer, primary_key=True)
    start_time = db.Column(db.DateTime, nullable=False)
+   end_time = db.Column(db.DateTime, nullable=False)
    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), nullable=False)
    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
+
+   # Row version, bumped on every update. Feeds the detail page ETag/Last-Modified
+   updated_at = db.Column(db.DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+class VenueShowCount(db.Model):
+   """Precomputed number of upcoming shows per venue, kept current by triggers on Show."""
+   __tablename__ = 'VenueShowCount'
+
+   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+   upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+
+class ArtistShowCount(db.Model):
+   """Precomputed number of upcoming shows per artist, kept current by triggers on Show."""
+   __tablename__ = 'ArtistShowCount'
+
+   artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+   upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+
+class ShowCounterState(db.Model):
+   """Single row holding the time up to which the show counters have been aged.
+
+   The counters count shows starting after `counted_after`; `flask age-show-counts`
+   moves it forward and takes the shows that started in between off the counts.
+   """
+   __tablename__ = 'ShowCounterState'
+
+   id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+   counted_after = db.Column(db.DateTime, nullable=False)
@@ -0,0 +1,65 @@
+"""Maintenance of the precomputed upcoming-show counters.
+
+VenueShowCount and ArtistShowCount hold, per venue and artist, the number of
+shows starting after ShowCounterState.counted_after. Triggers on Show keep
+them in step with inserts, updates and deletes (see migration e19a3c5f7b02).
+Time passing is handled here: `age` moves the watermark up to now and takes
+the shows that started in between off the counts. Run it periodically, e.g.
+every minute from cron via `flask age-show-counts`.
+"""
+from datetime import datetime
+
+from models import db, Show, VenueShowCount, ArtistShowCount, ShowCounterState
+
+COUNTERS = (
+    (VenueShowCount, VenueShowCount.venue_id, Show.venue_id),
+    (ArtistShowCount, ArtistShowCount.artist_id, Show.artist_id),
+)
+
+
+def lock_state():
+    """The watermark row, locked against the Show triggers until commit."""
+    return db.session.execute(
+        db.select(ShowCounterState).where(ShowCounterState.id == 1).with_for_update()
+    ).scalar_one()
+
+
+def age(now=None):
+    """Move shows that started since the last run from upcoming to past. Returns how many moved."""
+    now = now or datetime.now()
+    state = lock_state()
+    if now <= state.counted_after:
+        db.session.rollback()
+        return 0
+
+    started = (Show.start_time > state.counted_after) & (Show.start_time <= now)
+    moved = db.session.scalar(db.select(db.func.count(Show.id)).where(started))
+    for counter, counter_key, show_key in COUNTERS:
+        started_per_owner = db.select(
+            show_key.label('owner_id'), db.func.count(Show.id).label('shows')
+        ).where(started).group_by(show_key).subquery()
+        db.session.execute(
+            db.update(counter)
+            .where(counter_key == started_per_owner.c.owner_id)
+            .values(upcoming_shows=counter.upcoming_shows - started_per_owner.c.shows)
+        )
+
+    state.counted_after = now
+    db.session.commit()
+    return moved
+
+
+def rebuild(now=None):
+    """Recompute every counter from the Show table, with the watermark set to now."""
+    now = now or datetime.now()
+    state = lock_state()
+    for counter, counter_key, show_key in COUNTERS:
+        db.session.execute(db.delete(counter))
+        db.session.execute(
+            db.insert(counter).from_select(
+                [counter_key.key, 'upcoming_shows'],
+                db.select(show_key, db.func.count(Show.id)).where(Show.start_time > now).group_by(show_key)
+            )
+        )
+    state.counted_after = now
+    db.session.commit()
@@ -0,0 +1,70 @@
+"""Read-replica routing against two SQLite files standing in for the primary and a replica."""
+import pytest
+from flask import jsonify
+
+import config
+from app import create_app
+from database import replica_read
+from models import db
+
+
+@pytest.fixture
+def client(tmp_path):
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    settings.update(
+        TESTING=True,
+        SECRET_KEY='test',
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={'replica_0': f"sqlite:///{tmp_path / 'replica.db'}"},
+        PAGE_CACHE_BACKEND=None,
+        ACCESS_LOG_PATH='',
+        ERROR_LOG_PATH=str(tmp_path / 'error.log'),
+        JINJA_PRECOMPILE=False,
+        JINJA_BYTECODE_CACHE_DIR=None,
+    )
+    app = create_app(type('Settings', (), settings))
+
+    # Each database names itself, so a response shows where its read went
+    with app.app_context():
+        for bind, engine in (('primary', db.engines[None]), ('replica', db.engines['replica_0'])):
+            with engine.begin() as connection:
+                connection.exec_driver_sql('CREATE TABLE source (name TEXT)')
+                connection.exec_driver_sql(f"INSERT INTO source VALUES ('{bind}')")
+
+    def read_source():
+        return db.session.execute(db.text('SELECT name FROM source')).scalar()
+
+    @app.route('/source')
+    @replica_read
+    def source():
+        return jsonify(read_source())
+
+    @app.route('/source', methods=['POST'])
+    def write_source():
+        return jsonify(read_source())
+
+    return app.test_client()
+
+
+def test_reads_follow_the_read_your_writes_window(client):
+    assert client.get('/source').json == 'replica'
+    # Views not marked replica_read, writes among them, use the primary
+    assert client.post('/source').json == 'primary'
+    # Right after a write the same client reads from the primary
+    assert client.get('/source').json == 'primary'
+
+
+def test_window_is_per_client(client):
+    client.post('/source')
+    other = client.application.test_client()
+    assert other.get('/source').json == 'replica'
+
+
+def test_window_closes(client, monkeypatch):
+    import database
+
+    client.post('/source')
+    window = client.application.config['READ_YOUR_WRITES_SECONDS']
+    now = database.time.time()
+    monkeypatch.setattr(database.time, 'time', lambda: now + window + 1)
+    assert client.get('/source').json == 'replica'